@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from manifest import load_manifest, save_manifest
+
+RENDER_MANIFEST = 'render_manifest.json'
+
+# Query arguments of a job, in query_data_by_date_range order
+JOB_KEYS = ['start_date', 'end_date', 'min_latitude', 'max_latitude', 'min_longitude', 'max_longitude',
+            'depth_bin_size', 'depth_limit']
+JOB_DEFAULTS = {'depth_bin_size': 100, 'depth_limit': 10000}
+
+def load_jobs(jobs_file):
+    # A JSON list of job objects or a CSV with one job per row, using JOB_KEYS
+    # (plus an optional name) as keys / column names
+    if jobs_file.endswith('.json'):
+        with open(jobs_file, 'r') as file:
+            return json.load(file)
+    return pd.read_csv(jobs_file).to_dict('records')
+
+def job_arguments(job):
+    return [job.get(key, JOB_DEFAULTS.get(key)) for key in JOB_KEYS]
+
+def job_name(job):
+    # File name stem: the job's own name, or one built from its arguments. A blank
+    # name in a CSV comes back from read_csv as NaN and counts as missing.
+    name = job.get('name')
+    if name is None or pd.isna(name) or not str(name).strip():
+        name = '_'.join(str(value) for value in job_arguments(job))
+    return re.sub(r'[^A-Za-z0-9_.+-]+', '_', str(name))
+
+def _source_stat(db_file):
+    # Cheap change check on the database; a shard directory has no single file to
+    # stat, so its jobs always fall through to comparing query results
+    if os.path.isdir(db_file):
+        return None
+    stat = os.stat(db_file)
+    return [stat.st_size, stat.st_mtime]
+
+def _result_hash(df):
+    return hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+def _outputs_exist(entry, outputs):
+    # A job whose query came back empty has nothing to draw
+    return entry['rows'] == 0 or all(os.path.exists(output) for output in outputs)
+
+def _is_current(entry, job, formats, stat, output_dir, name):
+    # Same job, same database file and every output still on disk
+    outputs = [os.path.join(output_dir, f'{name}.{fmt}') for fmt in formats]
+    return (entry is not None and stat is not None
+            and entry['job'] == job_arguments(job) and entry['formats'] == list(formats)
+            and entry['stat'] == stat and _outputs_exist(entry, outputs))
+
+def _render_job(db_file, job, formats, output_dir, name, entry, dpi):
+    # Runs in a worker process: query, and render unless the result is unchanged.
+    # Agg is selected before pyplot is used so no display is ever needed.
+    import matplotlib
+    matplotlib.use('Agg', force=True)
+    import matplotlib.pyplot as plt
+    from main import draw_temperature_cubes, query_data_by_date_range
+
+    arguments = job_arguments(job)
+    if os.path.isdir(db_file):
+        from shards import query_shards
+        df = query_shards(db_file, *arguments)
+    else:
+        df = query_data_by_date_range(db_file, *arguments)
+    if df is None:
+        return name, 'failed', None
+
+    new_entry = {'job': arguments, 'formats': list(formats), 'stat': _source_stat(db_file),
+                 'result': _result_hash(df), 'rows': len(df)}
+    outputs = [os.path.join(output_dir, f'{name}.{fmt}') for fmt in formats]
+    if (entry is not None and entry['job'] == arguments and entry['formats'] == list(formats)
+            and entry['result'] == new_entry['result'] and _outputs_exist(new_entry, outputs)):
+        # The database changed, but not for this job
+        return name, 'unchanged', new_entry
+    if df.empty:
+        return name, 'empty', new_entry
+
+    fig = draw_temperature_cubes(df, arguments[0], arguments[1], arguments[6])
+    for output in outputs:
+        fig.savefig(output, dpi=dpi)
+    plt.close(fig)
+    return name, 'rendered', new_entry
+
+def render_batch(db_file, jobs, output_dir, formats=('png',), max_workers=None, dpi=150, force=False):
+    # Query and render each (region, date range, bin size, depth limit) job to
+    # output_dir/<name>.<format> in a process pool. db_file may be a database or a
+    # shard directory (shards.py). Jobs whose database, arguments and outputs are
+    # unchanged since the last run are skipped without querying; when the database
+    # changed, a job is only redrawn if its query result did.
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_file = os.path.join(output_dir, RENDER_MANIFEST)
+    manifest = {} if force else load_manifest(manifest_file)
+    stat = _source_stat(db_file)
+
+    # Jobs sharing a name would overwrite each other's images and manifest entry
+    names = [job_name(job) for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"duplicate job names: {', '.join(duplicates)}")
+
+    counts = {'rendered': 0, 'unchanged': 0, 'skipped': 0, 'empty': 0, 'failed': 0}
+    pending = []
+    for job, name in zip(jobs, names):
+        if _is_current(manifest.get(name), job, formats, stat, output_dir, name):
+            counts['skipped'] += 1
+        else:
+            pending.append((job, name))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_render_job, db_file, job, formats, output_dir, name, manifest.get(name), dpi)
+                   for job, name in pending]
+        for future in as_completed(futures):
+            try:
+                name, status, entry = future.result()
+            except Exception as e:
+                print(f"An error occurred: {e}")
+                counts['failed'] += 1
+                continue
+            counts[status] += 1
+            if entry is not None:
+                manifest[name] = entry
+                # Saved as jobs finish so an interrupted batch keeps its progress
+                save_manifest(manifest, manifest_file)
+
+    print(f"Rendered {counts['rendered']} of {len(jobs)} jobs into {output_dir} "
+          f"({counts['skipped'] + counts['unchanged']} unchanged, {counts['empty']} empty, {counts['failed']} failed)")
+    return counts
+
+
+# Example usage
+if __name__ == "__main__":
+    db_file = '/home/jpforbes/workspace/github.com/jpforbes5151/csvScraper/database/oceandata.db'
+    output_dir = './content/figures'
+
+    # One job per month of 2003 for the default region
+    jobs = [{'name': f'region_2003-{month:02d}', 'start_date': f'2003-{month:02d}-01',
+             'end_date': f'2003-{month:02d}-28', 'min_latitude': 50, 'max_latitude': 51,
+             'min_longitude': -42, 'max_longitude': -40, 'depth_bin_size': 100, 'depth_limit': 1000}
+            for month in range(1, 13)]
+    render_batch(db_file, jobs, output_dir, formats=('png', 'svg'))
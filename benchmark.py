@@ -0,0 +1,121 @@
+import gc
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+import matplotlib
+matplotlib.use('Agg')  # render off-screen so plotting can be timed
+import matplotlib.pyplot as plt
+
+import main
+from generate_wod import generate_export
+from parser import parse_casts, create_matrix
+from parserbybin import bin_and_average, write_to_csv
+from database import create_and_populate_db, bulk_load
+
+# (casts, levels per cast) for each benchmark run
+SIZES = [(100, 100), (1000, 100), (5000, 100)]
+
+# Cube plotting builds six faces per point, so cap the rows handed to it to keep
+# the plot stage comparable across sizes
+PLOT_LIMIT = 2000
+
+def measure(label, size, func, *args, rows=None, rerun=None):
+    # Time one stage, then run it again under tracemalloc for its peak Python/NumPy
+    # allocation (tracing slows allocation-heavy code, so it is kept out of the timing).
+    # rerun replaces the second call for stages with side effects such as files.
+    gc.collect()
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+
+    gc.collect()
+    tracemalloc.start()
+    if rerun is not None:
+        rerun()
+    else:
+        func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    count = rows(result) if rows is not None else None
+    rate = f"{count / elapsed:>12,.0f}" if count and elapsed else f"{'':>12}"
+    print(f"{label:<26} {size:>12} {count if count is not None else '':>10} "
+          f"{elapsed:>9.3f} {rate} {peak / (1024 * 1024):>9.1f}")
+    return result
+
+def render_cubes(df, start_date, end_date, depth_bin_size):
+    # Build the cube figure and rasterize it; under Agg plt.show() draws nothing,
+    # so the canvas is drawn explicitly to time the actual rendering
+    fig = main.draw_temperature_cubes(df, start_date, end_date, depth_bin_size)
+    fig.canvas.draw()
+    plt.close(fig)
+
+def run_size(work_dir, casts, levels):
+    size = f"{casts}x{levels}"
+    input_file = os.path.join(work_dir, f'ocldb_{size}.CTD.csv')
+    output_file = os.path.join(work_dir, f'binned_{size}.csv')
+    db_file = os.path.join(work_dir, f'oceandata_{size}.db')
+
+    generate_export(input_file, casts=casts, levels=levels)
+
+    parsed = measure('parse_casts', size, parse_casts, input_file,
+                     rows=lambda r: sum(len(c['variables']) for c in r))
+    matrix = measure('create_matrix', size, create_matrix, parsed, rows=len)
+    binned = measure('bin_and_average', size, bin_and_average, matrix, rows=len)
+    output_file = measure('write_to_csv', size, write_to_csv, binned, output_file,
+                          rerun=lambda: write_to_csv(binned, output_file + '.trace.csv'))
+    measure('create_and_populate_db', size, create_and_populate_db, output_file, db_file,
+            rerun=lambda: create_and_populate_db(output_file, db_file + '.trace'))
+    measure('bulk_load', size, bulk_load, binned, db_file + '.bulk', rows=lambda r: r['inserted'],
+            rerun=lambda: bulk_load(binned, db_file + '.bulk.trace'))
+
+    # Query the whole synthetic region and date range
+    result = measure('query_data_by_date_range', size, main.query_data_by_date_range,
+                     db_file, '1970-01-01', '2023-12-31', 50, 51, -42, -40, 100, 1000, rows=len)
+
+    measure('draw_temperature_cubes', size, render_cubes, result.head(PLOT_LIMIT),
+            '1970-01-01', '2023-12-31', 100, rows=lambda r: min(len(result), PLOT_LIMIT))
+
+def run_date_queries(work_dir, casts=20000, levels=100, repeats=5):
+    # Compare a one-year range query on a database without Date_key (string-built
+    # dates, full scan) against the same data with the indexed Date_key column
+    input_file = os.path.join(work_dir, 'ocldb_dates.CTD.csv')
+    generate_export(input_file, casts=casts, levels=levels)
+    binned = bin_and_average(create_matrix(parse_casts(input_file)))
+
+    legacy_db = os.path.join(work_dir, 'legacy.db')
+    conn = sqlite3.connect(legacy_db)
+    binned.to_sql('cast_data', conn, index=False)
+    conn.close()
+
+    indexed_db = os.path.join(work_dir, 'indexed.db')
+    bulk_load(binned, indexed_db)
+
+    print(f"\n{'date range query':<26} {'rows':>10} {'seconds':>9}")
+    timings = {}
+    for label, db_file in (('string dates (scan)', legacy_db), ('Date_key (index)', indexed_db)):
+        started = time.perf_counter()
+        for _ in range(repeats):
+            result = main.query_data_by_date_range(db_file, '2001-01-01', '2001-12-31', 50, 51, -42, -40, 100, 1000)
+        timings[label] = (time.perf_counter() - started) / repeats
+        print(f"{label:<26} {len(result):>10} {timings[label]:>9.4f}")
+    print(f"speedup: {timings['string dates (scan)'] / timings['Date_key (index)']:.1f}x")
+
+def run(sizes=SIZES):
+    print(f"{'stage':<26} {'size':>12} {'rows':>10} {'seconds':>9} {'rows/sec':>12} {'peak MB':>9}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for casts, levels in sizes:
+            run_size(work_dir, casts, levels)
+        run_date_queries(work_dir)
+
+
+# Example usage: python benchmark.py [casts levels ...]
+if __name__ == "__main__":
+    arguments = [int(a) for a in sys.argv[1:]]
+    if arguments:
+        run(list(zip(arguments[::2], arguments[1::2])))
+    else:
+        run()
@@ -0,0 +1,129 @@
+import json
+import mmap
+import os
+import pandas as pd
+from parser import CAST_SEPARATOR, VARIABLE_KEYS, iter_casts_from_lines
+
+INDEX_SUFFIX = '.idx.json'
+INDEX_KEYS = ['CAST', 'Latitude', 'Longitude', 'Year', 'Month', 'Day']
+
+def index_path(file_path):
+    return file_path + INDEX_SUFFIX
+
+def _header_metadata(header):
+    # Same key/value rule as the parser's metadata section, limited to INDEX_KEYS
+    metadata = {}
+    for line in header.splitlines():
+        parts = line.split(',')
+        if len(parts) > 2:
+            key = parts[0].strip()
+            if key in INDEX_KEYS:
+                metadata[key] = parts[2].strip()
+    return metadata
+
+def build_cast_index(file_path):
+    # One mmap scan over the export: record the byte offset and length of every
+    # cast plus its key metadata, and save it next to the file as a sidecar
+    separator = CAST_SEPARATOR.encode()
+    offsets = []
+    rows = {key: [] for key in INDEX_KEYS}
+
+    with open(file_path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if size == 0:
+            return _save_index(file_path, pd.DataFrame(columns=['offset', 'length'] + INDEX_KEYS))
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            position = mm.find(separator)
+            while position != -1:
+                offsets.append(position)
+                position = mm.find(separator, position + len(separator))
+            offsets.append(size)
+
+            for start, end in zip(offsets[:-1], offsets[1:]):
+                # Metadata lives between the separator and the VARIABLES header
+                header_end = mm.find(b'VARIABLES', start, end)
+                header = mm[start:header_end if header_end != -1 else end].decode()
+                metadata = _header_metadata(header)
+                for key in INDEX_KEYS:
+                    rows[key].append(metadata.get(key))
+
+    index = pd.DataFrame({'offset': offsets[:-1], 'length': [e - s for s, e in zip(offsets[:-1], offsets[1:])]})
+    for key in INDEX_KEYS:
+        index[key] = pd.to_numeric(pd.Series(rows[key], dtype=object), errors='coerce')
+
+    return _save_index(file_path, index)
+
+def _save_index(file_path, index):
+    stat = os.stat(file_path)
+    sidecar = {
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+        'columns': {column: index[column].tolist() for column in index.columns}
+    }
+    with open(index_path(file_path), 'w') as file:
+        json.dump(sidecar, file)
+    return index
+
+def load_cast_index(file_path):
+    # Use the sidecar if it still matches the export, otherwise rebuild it
+    try:
+        with open(index_path(file_path), 'r') as file:
+            sidecar = json.load(file)
+        stat = os.stat(file_path)
+        if sidecar['source_size'] == stat.st_size and sidecar['source_mtime'] == stat.st_mtime:
+            return pd.DataFrame(sidecar['columns'])
+    except (OSError, ValueError, KeyError):
+        pass
+    return build_cast_index(file_path)
+
+def _read_casts(file_path, entries, variables):
+    # Seek straight to each indexed cast and parse only those bytes
+    with open(file_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset, length in entries:
+                text = mm[offset:offset + length].decode()
+                yield from iter_casts_from_lines(text.splitlines(True), variables)
+
+def read_cast(file_path, n, variables=VARIABLE_KEYS):
+    # Fetch the n-th cast (0-based, in file order)
+    index = load_cast_index(file_path)
+    row = index.iloc[n]
+    return next(_read_casts(file_path, [(int(row['offset']), int(row['length']))], variables))
+
+def find_casts(file_path, variables=VARIABLE_KEYS, cast_ids=None, start_date=None, end_date=None,
+               min_latitude=None, max_latitude=None, min_longitude=None, max_longitude=None):
+    # Yield the casts whose indexed metadata matches every filter given.
+    # Dates are 'YYYY-MM-DD' strings, as in main.query_data_by_date_range.
+    index = load_cast_index(file_path)
+    mask = pd.Series(True, index=index.index)
+
+    if cast_ids is not None:
+        mask &= index['CAST'].isin(list(cast_ids))
+    if min_latitude is not None:
+        mask &= index['Latitude'] >= float(min_latitude)
+    if max_latitude is not None:
+        mask &= index['Latitude'] <= float(max_latitude)
+    if min_longitude is not None:
+        mask &= index['Longitude'] >= float(min_longitude)
+    if max_longitude is not None:
+        mask &= index['Longitude'] <= float(max_longitude)
+    if start_date is not None or end_date is not None:
+        dates = pd.to_datetime(index[['Year', 'Month', 'Day']].rename(columns=str.lower), errors='coerce')
+        if start_date is not None:
+            mask &= dates >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= dates <= pd.Timestamp(end_date)
+
+    selected = index[mask]
+    entries = zip(selected['offset'].astype(int), selected['length'].astype(int))
+    yield from _read_casts(file_path, entries, variables)
+
+
+# Example usage
+if __name__ == "__main__":
+    input_file = './content/ocldb1571108899.16715.CTD2.csv'
+
+    index = load_cast_index(input_file)
+    print(f"{len(index)} casts indexed")
+    print(read_cast(input_file, 0))
@@ -0,0 +1,84 @@
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Typed on-disk columns; anything not listed (extra variables) is stored as float64
+COLUMN_TYPES = {
+    'Latitude': np.float64,
+    'Longitude': np.float64,
+    'Year': np.int16,  # rows without a year are dropped by _typed
+    # Nullable: create_matrix leaves a missing date part or cast number as NaN
+    'Month': 'Int8',
+    'Day': 'Int8',
+    'Cast_number': 'Int64',
+    'Depth': np.float64,
+    'Depth_bin': np.float64,
+    'Temperature': np.float64,
+    'Salinity': np.float64,
+}
+PARTITION_COLUMN = 'Year'
+
+def _typed(df):
+    types = {column: COLUMN_TYPES.get(column, np.float64) for column in df.columns}
+    # Rows without a year cannot be placed in a partition
+    df = df.dropna(subset=[PARTITION_COLUMN])
+    return df.astype(types)
+
+def write_to_parquet(df, output_dir, compression='zstd'):
+    # Write a DataFrame (or an iterable of DataFrame chunks) as a Parquet dataset
+    # partitioned by year: output_dir/Year=2003/part-0-0.parquet, ...
+    # Needs pyarrow (pip install pyarrow).
+    if os.path.exists(output_dir):
+        # Append timestamp to the directory name, as write_to_csv does for files
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        output_dir = f"{output_dir.rstrip(os.sep)}_{timestamp}"
+
+    if isinstance(df, pd.DataFrame):
+        df = [df]
+
+    for i, chunk in enumerate(df):
+        if chunk.empty:
+            continue
+        _typed(chunk).to_parquet(
+            output_dir,
+            index=False,
+            compression=compression,
+            partition_cols=[PARTITION_COLUMN],
+            basename_template=f'part-{i}-{{i}}.parquet'
+        )
+
+    print(f'Data written to {output_dir}')
+    return output_dir
+
+def read_parquet(path, columns=None, start_year=None, end_year=None):
+    # Read a dataset written by write_to_parquet; only the partitions inside the
+    # year range are opened and only the requested columns are decoded
+    filters = []
+    if start_year is not None:
+        filters.append((PARTITION_COLUMN, '>=', int(start_year)))
+    if end_year is not None:
+        filters.append((PARTITION_COLUMN, '<=', int(end_year)))
+
+    df = pd.read_parquet(path, columns=columns, filters=filters or None)
+
+    # The partition column comes back as a category at the end; restore the
+    # integer year and the usual column order
+    if PARTITION_COLUMN in df.columns:
+        df[PARTITION_COLUMN] = df[PARTITION_COLUMN].astype(COLUMN_TYPES[PARTITION_COLUMN])
+    if columns is None:
+        columns = [c for c in COLUMN_TYPES if c in df.columns]
+        columns += [c for c in df.columns if c not in columns]
+    return df[list(columns)]
+
+
+# Example usage
+if __name__ == "__main__":
+    from parser import iter_casts, iter_matrix_chunks
+    from parserbybin import bin_and_average
+
+    input_file = './content/ocldb1571108899.16715.CTD5.csv'
+    output_dir = './content/parsed/parsed_data.parquet'
+
+    averaged_df = bin_and_average(iter_matrix_chunks(iter_casts(input_file)))
+    write_to_parquet(averaged_df, output_dir)
@@ -0,0 +1,51 @@
+import numpy as np
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+
+# Corners of a cube around its centre, in units of its half size
+CUBE_CORNERS = np.array([
+    [-1, -1, -1],
+    [1, -1, -1],
+    [1, 1, -1],
+    [-1, 1, -1],
+    [-1, -1, 1],
+    [1, -1, 1],
+    [1, 1, 1],
+    [-1, 1, 1],
+], dtype=np.float64)
+
+# Corner indices of the six faces
+CUBE_FACES = np.array([
+    [0, 1, 2, 3],
+    [4, 5, 6, 7],
+    [0, 1, 5, 4],
+    [2, 3, 7, 6],
+    [0, 3, 7, 4],
+    [1, 2, 6, 5],
+])
+
+def cube_polygons(x, y, z, half_size):
+    # Faces of one cube per point as a single (n * 6, 4, 3) array. half_size is a
+    # scalar, an (x, y, z) triple or one triple per point.
+    centers = np.column_stack([x, y, z]).astype(np.float64)
+    half = np.broadcast_to(np.asarray(half_size, dtype=np.float64), centers.shape)
+    vertices = centers[:, None, :] + CUBE_CORNERS[None, :, :] * half[:, None, :]
+    return vertices[:, CUBE_FACES].reshape(-1, 4, 3)
+
+def cube_size(x, y, z, fraction=0.1):
+    # A fraction of the smallest step between consecutive points. Points repeated
+    # at the same position (other dates) are skipped so the size can't reach zero.
+    distances = np.sqrt(np.diff(x) ** 2 + np.diff(y) ** 2 + np.diff(z) ** 2)
+    distances = distances[distances > 0]
+    if len(distances) == 0:
+        return 1.0
+    return np.min(distances) * fraction
+
+def draw_cubes(ax, x, y, z, values, half_size, cmap, norm, alpha=0.5, edgecolors='k', linewidths=1):
+    # Draw a cube per point, coloured by value, as one Poly3DCollection: the colour
+    # map is applied once to all values and every face shares one artist
+    values = np.asarray(values, dtype=np.float64)
+    colors = cmap(norm(values))
+    cubes = Poly3DCollection(cube_polygons(x, y, z, half_size), facecolors=np.repeat(colors, len(CUBE_FACES), axis=0),
+                             linewidths=linewidths, edgecolors=edgecolors, alpha=alpha)
+    ax.add_collection3d(cubes)
+    return cubes
@@ -1,44 +1,640 @@
+import os
+import time
 import pandas as pd
 import sqlite3
 
-def create_and_populate_db(csv_file, db_file):
+CAST_DATA_COLUMNS = ['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Cast_number', 'Date_key', 'Depth_bin',
+                     'Temperature', 'Salinity']
+
+CREATE_TABLE_QUERY = '''
+CREATE TABLE IF NOT EXISTS cast_data (
+    Latitude REAL,
+    Longitude REAL,
+    Year INTEGER,
+    Month INTEGER,
+    Day INTEGER,
+    Cast_number INTEGER,
+    Date_key INTEGER,
+    Depth_bin REAL,
+    Temperature REAL,
+    Salinity REAL
+)
+'''
+
+# Cast_number is WOD's unique cast number and identifies a cast. Rows loaded before
+# it was kept have none; those casts are told apart by position and date instead.
+CAST_KEYS = ['Latitude', 'Longitude', 'Year', 'Month', 'Day']
+MEASUREMENT_COLUMNS = ['Depth_bin', 'Temperature', 'Salinity']
+
+# Normalized layout: position/time stored once per cast, compact depth rows per
+# measurement, and a cast_data view so existing queries keep working
+NORMALIZED_SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS casts (
+        cast_id INTEGER PRIMARY KEY,
+        Latitude REAL,
+        Longitude REAL,
+        Year INTEGER,
+        Month INTEGER,
+        Day INTEGER,
+        Cast_number INTEGER,
+        Date_key INTEGER
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS measurements (
+        cast_id INTEGER NOT NULL REFERENCES casts (cast_id),
+        Depth_bin REAL,
+        Temperature REAL,
+        Salinity REAL
+    )
+    ''',
+]
+
+CAST_DATA_VIEW = '''
+CREATE VIEW cast_data AS
+SELECT
+    c.Latitude,
+    c.Longitude,
+    c.Year,
+    c.Month,
+    c.Day,
+    c.Cast_number,
+    c.Date_key,
+    m.Depth_bin,
+    m.Temperature,
+    m.Salinity
+FROM measurements m
+JOIN casts c ON c.cast_id = m.cast_id
+'''
+
+# Cast positions as degenerate boxes; id is casts.cast_id
+SPATIAL_INDEX = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS cast_positions USING rtree (
+    id,
+    min_lat, max_lat,
+    min_lon, max_lon
+)
+'''
+
+# Date_key is YYYYMMDD as an integer: sortable, indexable and cheap to compare,
+# unlike the string built from Year/Month/Day at query time
+DATE_INDEXES = {
+    'cast_data': ['CREATE INDEX IF NOT EXISTS cast_data_date_position '
+                  'ON cast_data (Date_key, Latitude, Longitude, Depth_bin)'],
+    'casts': ['CREATE INDEX IF NOT EXISTS casts_date_position ON casts (Date_key, Latitude, Longitude)'],
+}
+
+# Uniqueness keys enforced on ingest: one cast per cast number, and one row per
+# cast and depth bin, so reloading a file can't double-count readings. Casts
+# without a number fall back to one cast per position and date. The fallback keys
+# are partial and lead with the date parts, so the planner never picks them over
+# the Date_key indexes for a box query.
+UNIQUE_INDEXES = {
+    'cast_data': ['CREATE UNIQUE INDEX IF NOT EXISTS cast_data_cast_number_key '
+                  'ON cast_data (Cast_number, Depth_bin) WHERE Cast_number IS NOT NULL',
+                  'CREATE UNIQUE INDEX IF NOT EXISTS cast_data_position_key '
+                  'ON cast_data (Year, Month, Day, Latitude, Longitude, Depth_bin) WHERE Cast_number IS NULL'],
+    'casts': ['CREATE UNIQUE INDEX IF NOT EXISTS casts_cast_number_key ON casts (Cast_number) WHERE Cast_number IS NOT NULL',
+              'CREATE UNIQUE INDEX IF NOT EXISTS casts_position_key '
+              'ON casts (Year, Month, Day, Latitude, Longitude) WHERE Cast_number IS NULL',
+              'CREATE UNIQUE INDEX IF NOT EXISTS measurements_measurement_key ON measurements (cast_id, Depth_bin)'],
+}
+# Indexes from earlier layouts that the keys above replace
+SUPERSEDED_INDEXES = ['casts_position_date', 'measurements_cast_depth', 'cast_data_measurement_key', 'casts_cast_key',
+                      'cast_data_unique_key', 'casts_unique_key']
+
+# Rows are staged here and moved into the store with one set-based upsert per batch
+STAGING_TABLE = '''
+CREATE TEMP TABLE IF NOT EXISTS staging (
+    Latitude REAL,
+    Longitude REAL,
+    Year INTEGER,
+    Month INTEGER,
+    Day INTEGER,
+    Cast_number INTEGER,
+    Date_key INTEGER,
+    Depth_bin REAL,
+    Temperature REAL,
+    Salinity REAL
+)
+'''
+
+# Staged position/date keys of numbered casts, for _adopt_unnumbered_casts
+ADOPTION_TABLE = '''
+CREATE TEMP TABLE IF NOT EXISTS adoption (
+    Latitude REAL,
+    Longitude REAL,
+    Year INTEGER,
+    Month INTEGER,
+    Day INTEGER,
+    Cast_number INTEGER
+)
+'''
+
+# Depth resolutions kept as pre-aggregated rollup tables by build_rollups
+ROLLUP_SIZES = [50, 100, 500]
+ROLLUP_KEYS = ['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Depth_bin']
+ROLLUP_VALUES = ['Temperature', 'Salinity']
+
+# Loader-time settings: the database is only being filled, so trade durability
+# during the load for speed (a crash means rerunning the load). All of these only
+# last as long as the loader's connection.
+LOADER_PRAGMAS = [
+    'PRAGMA synchronous=OFF',
+    'PRAGMA cache_size=-200000',  # ~200 MB page cache
+    'PRAGMA temp_store=MEMORY',
+]
+
+# Lookup indexes are dropped and rebuilt once only when a load adds more than this
+# fraction of the rows already stored; smaller loads update them in place
+DEFER_INDEXES_FRACTION = 0.25
+
+def create_and_populate_db(csv_file, db_file, on_conflict='skip'):
+    # csv_file may also be a Parquet dataset written by columnar.write_to_parquet
     try:
-        # Read the CSV file into a DataFrame
-        df = pd.read_csv(csv_file)
+        if os.path.isdir(csv_file) or csv_file.endswith('.parquet'):
+            # Typed columns straight from Parquet, no text re-parse
+            from columnar import read_parquet
+            df = read_parquet(csv_file)
+        else:
+            # Read the CSV file into a DataFrame
+            df = pd.read_csv(csv_file)
 
-        # Create a new SQLite database (or connect to an existing one)
-        conn = sqlite3.connect(db_file)
+        # Load through the bulk loader so the uniqueness keys, Date_key and any
+        # rollups are maintained the same way for every ingest path
+        return bulk_load(df, db_file, on_conflict=on_conflict)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+
+def date_key(date):
+    # 'YYYY-MM-DD' (or a date) -> YYYYMMDD integer as stored in Date_key
+    return int(str(date)[:10].replace('-', ''))
+
+def add_date_key(df):
+    # Widened first: Parquet's int16/int8 date columns overflow at Year * 10000.
+    # float64 holds YYYYMMDD exactly and keeps a missing part as NaN (bound as NULL).
+    dates = df[['Year', 'Month', 'Day']].astype('float64')
+    return df.assign(Date_key=dates['Year'] * 10000 + dates['Month'] * 100 + dates['Day'])
+
+def _columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+def ensure_cast_number(conn):
+    # Add the Cast_number column to databases created before it existed. Their rows
+    # keep a NULL cast number and the position/date fallback key.
+    table = 'casts' if is_normalized(conn) else 'cast_data'
+    if 'Cast_number' not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN Cast_number INTEGER')
+        if table == 'casts':
+            # Rebuild the view so it exposes the new column
+            conn.execute('DROP VIEW cast_data')
+            conn.execute(CAST_DATA_VIEW)
+
+def ensure_date_key(conn):
+    # Add and backfill Date_key on databases created before it existed, then make
+    # sure its composite indexes are present
+    table = 'casts' if is_normalized(conn) else 'cast_data'
+    # The view rebuilt below selects Cast_number as well
+    ensure_cast_number(conn)
+    if 'Date_key' not in _columns(conn, table):
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN Date_key INTEGER')
+        conn.execute(f'UPDATE {table} SET Date_key = Year * 10000 + Month * 100 + Day')
+        if table == 'casts':
+            # Rebuild the view so it exposes the new column
+            conn.execute('DROP VIEW cast_data')
+            conn.execute(CAST_DATA_VIEW)
+    for statement in DATE_INDEXES[table]:
+        conn.execute(statement)
+    conn.commit()
+
+def has_spatial_index(conn):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'cast_positions'").fetchone()
+    return row is not None
+
+def ensure_spatial_index(conn):
+    # R*Tree of cast positions for bounding-box queries on a normalized database.
+    # Cast ids only grow, so casts newer than the last indexed id are the ones to add.
+    # Returns False when this SQLite build has no R*Tree module.
+    try:
+        conn.execute(SPATIAL_INDEX)
+    except sqlite3.OperationalError:
+        return False
+    conn.execute('''
+        INSERT INTO cast_positions (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT cast_id, Latitude, Latitude, Longitude, Longitude
+        FROM casts
+        WHERE cast_id > (SELECT COALESCE(MAX(id), 0) FROM cast_positions)
+            AND Latitude IS NOT NULL AND Longitude IS NOT NULL
+    ''')
+    return True
+
+def longitude_ranges(min_longitude, max_longitude):
+    # A box whose minimum longitude is east of its maximum crosses the antimeridian
+    # and is searched as two boxes either side of it
+    min_longitude, max_longitude = float(min_longitude), float(max_longitude)
+    if min_longitude <= max_longitude:
+        return [(min_longitude, max_longitude)]
+    return [(min_longitude, 180.0), (-180.0, max_longitude)]
+
+def rollup_table(bin_size):
+    return f'rollup_{int(bin_size)}'
+
+def rollup_sizes(conn):
+    # Resolutions that currently have a rollup table
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'rollup_%'")
+    return sorted(int(name[len('rollup_'):]) for (name,) in rows)
+
+def _rollup_source(conn):
+    # Where base rows live and the rowid that grows as they are appended
+    if is_normalized(conn):
+        return 'measurements m JOIN casts c ON c.cast_id = m.cast_id', 'm.rowid'
+    return 'cast_data', 'rowid'
+
+def source_rowid(conn):
+    # Highest base rowid so far; rows loaded afterwards have larger ones
+    table = 'measurements' if is_normalized(conn) else 'cast_data'
+    row = conn.execute(f"SELECT name FROM sqlite_master WHERE name = '{table}' AND type = 'table'").fetchone()
+    if row is None:
+        return 0
+    return conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {table}').fetchone()[0]
+
+def _fold_into_rollup(conn, bin_size, since_rowid):
+    # Add base rows with rowid > since_rowid to one rollup table. Depth_bin uses the
+    # same CAST(... AS INTEGER) expression as query_data_by_date_range, and sums and
+    # counts are added onto existing rows, so the rollup always equals re-aggregating.
+    source, rowid = _rollup_source(conn)
+    depth = f'CAST(Depth_bin / {bin_size} AS INTEGER) * {bin_size}'
+    sums = ', '.join(f'TOTAL({v}), COUNT({v})' for v in ROLLUP_VALUES)
+    columns = ', '.join(f'{v}_sum, {v}_count' for v in ROLLUP_VALUES)
+    updates = ', '.join(f'{v}_{stat} = {v}_{stat} + excluded.{v}_{stat}'
+                        for v in ROLLUP_VALUES for stat in ('sum', 'count'))
+    conn.execute(f'''
+        INSERT INTO {rollup_table(bin_size)} (Latitude, Longitude, Year, Month, Day, Date_key, Depth_bin, {columns})
+        SELECT Latitude, Longitude, Year, Month, Day, Date_key, {depth}, {sums}
+        FROM {source}
+        WHERE {rowid} > ?
+        GROUP BY Latitude, Longitude, Year, Month, Day, Date_key, {depth}
+        ON CONFLICT (Year, Month, Day, Latitude, Longitude, Depth_bin) DO UPDATE SET {updates}
+    ''', (since_rowid,))
+
+def update_rollups(conn, since_rowid):
+    # Incremental maintenance after a load: fold only the newly appended rows
+    for bin_size in rollup_sizes(conn):
+        _fold_into_rollup(conn, bin_size, since_rowid)
+
+def build_rollups(db_file, bin_sizes=ROLLUP_SIZES):
+    # Create (or rebuild) rollup tables of per-bin sums and counts for the given
+    # depth resolutions. Loads keep them current from then on. The key leads with
+    # the date parts like the uniqueness keys, so box queries use the Date_key
+    # index rather than a Latitude-first key.
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        cursor = conn.cursor()
+        ensure_date_key(conn)
+        cursor.execute('BEGIN')
+        for bin_size in bin_sizes:
+            table = rollup_table(bin_size)
+            columns = ',\n'.join(f'{v}_sum REAL, {v}_count INTEGER' for v in ROLLUP_VALUES)
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            cursor.execute(f'''
+                CREATE TABLE {table} (
+                    Latitude REAL,
+                    Longitude REAL,
+                    Year INTEGER,
+                    Month INTEGER,
+                    Day INTEGER,
+                    Date_key INTEGER,
+                    Depth_bin INTEGER,
+                    {columns},
+                    PRIMARY KEY (Year, Month, Day, Latitude, Longitude, Depth_bin)
+                )
+            ''')
+            cursor.execute(f'CREATE INDEX {table}_date_position ON {table} (Date_key, Latitude, Longitude)')
+            _fold_into_rollup(conn, bin_size, 0)
+        cursor.execute('COMMIT')
+        print(f"Built rollups for {', '.join(f'{size}m' for size in bin_sizes)} bins.")
+
+    except Exception as e:
+        if conn and conn.in_transaction:
+            conn.rollback()
+        print(f"An error occurred: {e}")
+
+    finally:
+        if conn:
+            conn.close()
+
+def is_normalized(conn):
+    # True once migrate_to_normalized has replaced the cast_data table with a view
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = 'cast_data'").fetchone()
+    return row is not None and row[0] == 'view'
+
+def ensure_unique_keys(conn):
+    # Swap the plain lookup indexes of older layouts for the uniqueness keys. Fails
+    # if the database already holds duplicates; dedupe_database clears those first.
+    table = 'casts' if is_normalized(conn) else 'cast_data'
+    for name in SUPERSEDED_INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+    try:
+        for statement in UNIQUE_INDEXES[table]:
+            conn.execute(statement)
+    except sqlite3.IntegrityError:
+        raise sqlite3.IntegrityError(f"{table} holds duplicate casts or depth bins; "
+                                     f"run dedupe_database() once before loading")
+
+def _rebuild_rollups(conn):
+    # Replaced or deleted rows can't be folded in incrementally, so start over
+    for bin_size in rollup_sizes(conn):
+        conn.execute(f'DELETE FROM {rollup_table(bin_size)}')
+        _fold_into_rollup(conn, bin_size, 0)
+
+def _adopt_unnumbered_casts(conn, normalized):
+    # Stored casts without a number that share position and date with a staged
+    # numbered cast take its number, so reloading an export into an older database
+    # skips or replaces them instead of storing the cast twice. Where staged casts
+    # share a position and date the lowest number is taken; a number that is
+    # already stored is never given out again.
+    table = 'casts' if normalized else 'cast_data'
+    keys = ', '.join(CAST_KEYS)
+    conn.execute(ADOPTION_TABLE)
+    conn.execute(f'INSERT INTO adoption ({keys}, Cast_number) '
+                 f'SELECT {keys}, MIN(Cast_number) FROM staging WHERE Cast_number IS NOT NULL GROUP BY {keys}')
+    conn.execute(f'DELETE FROM adoption WHERE EXISTS (SELECT 1 FROM {table} t WHERE t.Cast_number = adoption.Cast_number)')
+    match = ' AND '.join(f'{table}.{key} = a.{key}' for key in CAST_KEYS)
+    conn.execute(f'UPDATE {table} SET Cast_number = a.Cast_number FROM adoption a WHERE {table}.Cast_number IS NULL AND {match}')
+    conn.execute('DELETE FROM adoption')
+
+def _upsert_staged(conn, normalized, on_conflict, unnumbered=False):
+    # Move the staged batch into the store, numbered and unnumbered casts each in
+    # one statement per table. Rows whose position or date is incomplete can't be
+    # placed and are left out. unnumbered says the store holds casts without a
+    # number that staged casts may adopt.
+    if on_conflict == 'replace':
+        action = 'DO UPDATE SET ' + ', '.join(f'{v} = excluded.{v}' for v in ROLLUP_VALUES)
+    else:
+        action = 'DO NOTHING'
+    complete = ' AND '.join(f's.{key} IS NOT NULL' for key in CAST_KEYS)
+    if unnumbered:
+        _adopt_unnumbered_casts(conn, normalized)
+
+    if normalized:
+        keys = CAST_KEYS + ['Cast_number', 'Date_key']
+        conn.execute(f"INSERT OR IGNORE INTO casts ({', '.join(keys)}) "
+                     f"SELECT DISTINCT {', '.join(f's.{key}' for key in keys)} "
+                     f"FROM staging s WHERE {complete}")
+        position = ' AND '.join(f'c.{key} = s.{key}' for key in CAST_KEYS)
+        values = ', '.join(f's.{column}' for column in MEASUREMENT_COLUMNS)
+        # Numbered casts are found by number, the others by position and date.
+        # ON CONFLICT after a SELECT needs a WHERE clause to parse unambiguously.
+        for match, rows in (('c.Cast_number = s.Cast_number', 's.Cast_number IS NOT NULL'),
+                            (f'c.Cast_number IS NULL AND {position}', 's.Cast_number IS NULL')):
+            conn.execute(f"INSERT INTO measurements (cast_id, {', '.join(MEASUREMENT_COLUMNS)}) "
+                         f"SELECT c.cast_id, {values} FROM staging s JOIN casts c ON {match} "
+                         f"WHERE {complete} AND {rows} ON CONFLICT (cast_id, Depth_bin) {action}")
+    else:
+        columns = ', '.join(CAST_DATA_COLUMNS)
+        for key, rows in (('(Cast_number, Depth_bin) WHERE Cast_number IS NOT NULL', 's.Cast_number IS NOT NULL'),
+                          ('(Year, Month, Day, Latitude, Longitude, Depth_bin) WHERE Cast_number IS NULL', 's.Cast_number IS NULL')):
+            conn.execute(f"INSERT INTO cast_data ({columns}) "
+                         f"SELECT {', '.join(f's.{column}' for column in CAST_DATA_COLUMNS)} FROM staging s "
+                         f"WHERE {complete} AND {rows} ON CONFLICT {key} {action}")
+
+    incomplete = conn.execute(f'SELECT COUNT(*) FROM staging s WHERE NOT ({complete})').fetchone()[0]
+    conn.execute('DELETE FROM staging')
+    return incomplete
+
+def _batches(chunks, batch_size):
+    # Rows of the incoming chunks as tuples in CAST_DATA_COLUMNS order, batch_size at a time
+    batch = []
+    for chunk in chunks:
+        chunk = add_date_key(chunk)
+        if 'Cast_number' not in chunk.columns:
+            # Files binned before cast numbers were kept
+            chunk = chunk.assign(Cast_number=None)
+        # As float so a missing date part or number (NaN, or NA from Parquet's
+        # nullable integers) binds as NULL
+        chunk = chunk.astype({column: 'float64' for column in ('Year', 'Month', 'Day', 'Cast_number')})
+        batch.extend(chunk[CAST_DATA_COLUMNS].itertuples(index=False, name=None))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def bulk_load(chunks, db_file, batch_size=50000, on_conflict='skip'):
+    # Stream binned rows (a DataFrame or an iterable of DataFrame chunks, e.g.
+    # parserbybin.iter_binned_casts) into cast_data, or into casts and measurements
+    # on a normalized database, inside one transaction. Batches go through a temp
+    # staging table and are upserted on the cast and depth-bin keys, so loading the
+    # same export twice leaves the database unchanged. on_conflict='skip' keeps the
+    # rows already stored, 'replace' overwrites their Temperature and Salinity.
+    # Lookup indexes are rebuilt once at the end only for loads that are large next
+    # to the table (DEFER_INDEXES_FRACTION). Returns {'inserted': n, 'replaced': n,
+    # 'skipped': n}.
+    if on_conflict not in ('skip', 'replace'):
+        raise ValueError("on_conflict must be 'skip' or 'replace'")
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+
+    conn = None
+    staged = 0
+    incomplete = 0
+    started = time.perf_counter()
+    try:
+        conn = sqlite3.connect(db_file, isolation_level=None)
         cursor = conn.cursor()
+        for pragma in LOADER_PRAGMAS:
+            cursor.execute(pragma)
+
+        normalized = is_normalized(conn)
+        if normalized:
+            tables = ('casts', 'measurements')
+        else:
+            tables = ('cast_data',)
+            cursor.execute(CREATE_TABLE_QUERY)
+        ensure_date_key(conn)
+        ensure_unique_keys(conn)
+        cursor.execute(STAGING_TABLE)
+        # Only databases with casts loaded before cast numbers were kept need adoption
+        unnumbered = cursor.execute(f'SELECT 1 FROM {tables[0]} WHERE Cast_number IS NULL LIMIT 1').fetchone() is not None
+        insert_query = f"INSERT INTO staging ({', '.join(CAST_DATA_COLUMNS)}) " \
+                       f"VALUES ({', '.join('?' for _ in CAST_DATA_COLUMNS)})"
+
+        # Lookup index definitions, in case the load turns out large enough to drop
+        # them and rebuild once. The uniqueness keys always stay: the upserts
+        # resolve conflicts against them.
+        cursor.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'index' "
+                       f"AND tbl_name IN ({', '.join('?' for _ in tables)}) AND sql IS NOT NULL "
+                       f"AND sql NOT LIKE 'CREATE UNIQUE%'", tables)
+        indexes = cursor.fetchall()
+        deferred = []
+
+        cursor.execute('BEGIN')
+        # Rowids only grow, so the highest one stands in for the table size
+        since_rowid = source_rowid(conn)
+
+        for batch in _batches(chunks, batch_size):
+            if not deferred and staged + len(batch) > DEFER_INDEXES_FRACTION * since_rowid:
+                for name, _ in indexes:
+                    cursor.execute(f'DROP INDEX "{name}"')
+                deferred = indexes
+            cursor.executemany(insert_query, batch)
+            incomplete += _upsert_staged(conn, normalized, on_conflict, unnumbered)
+            staged += len(batch)
+
+        table = 'measurements' if normalized else 'cast_data'
+        inserted = cursor.execute(f'SELECT COUNT(*) FROM {table} WHERE rowid > ?', (since_rowid,)).fetchone()[0]
+        if on_conflict == 'replace':
+            counts = {'inserted': inserted, 'replaced': staged - inserted - incomplete, 'skipped': incomplete}
+        else:
+            counts = {'inserted': inserted, 'replaced': 0, 'skipped': staged - inserted}
 
-        # Create a table with appropriate schema
-        create_table_query = '''
-        CREATE TABLE IF NOT EXISTS cast_data (
-            Latitude REAL,
-            Longitude REAL,
-            Year INTEGER,
-            Month INTEGER,
-            Day INTEGER,
-            Depth_bin REAL,
-            Temperature REAL,
-            Salinity REAL
-        )
-        '''
-        cursor.execute(create_table_query)
-        conn.commit()
-
-        # Insert the DataFrame data into the SQLite table
-        df.to_sql('cast_data', conn, if_exists='append', index=False)
-
-        print("Data has been written to the local database successfully.")
+        for _, sql in deferred:
+            cursor.execute(sql)
+        if normalized:
+            ensure_spatial_index(conn)
+        if counts['replaced']:
+            _rebuild_rollups(conn)
+        else:
+            update_rollups(conn, since_rowid)
+        cursor.execute('COMMIT')
+
+        elapsed = time.perf_counter() - started
+        print(f"Loaded {counts['inserted']} rows into {db_file} in {elapsed:.2f}s "
+              f"({counts['replaced']} replaced, {counts['skipped']} skipped)")
+        return counts
 
     except Exception as e:
+        if conn and conn.in_transaction:
+            conn.rollback()
         print(f"An error occurred: {e}")
+        return None
 
     finally:
-        # Ensure the connection is closed even if an error occurs
         if conn:
             conn.close()
 
+def dedupe_database(db_file):
+    # One-off cleanup for databases loaded before the uniqueness keys existed:
+    # keep the first copy of every cast and depth bin, drop the rest, then add the
+    # keys and rebuild the rollups from the cleaned rows
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        cursor = conn.cursor()
+        ensure_date_key(conn)
+        normalized = is_normalized(conn)
+        cursor.execute('BEGIN')
+
+        merged = 0
+        if normalized:
+            # Point measurements of repeated casts at the first cast with that key
+            keys = ', '.join(CAST_KEYS + ['Cast_number'])
+            match = ' AND '.join(f'c.{key} IS k.{key}' for key in CAST_KEYS + ['Cast_number'])
+            cursor.execute(f'''
+                CREATE TEMP TABLE cast_map AS
+                SELECT c.cast_id AS old_id, k.keep_id
+                FROM casts c
+                JOIN (SELECT MIN(cast_id) AS keep_id, {keys} FROM casts GROUP BY {keys}) k ON {match}
+                WHERE c.cast_id != k.keep_id
+            ''')
+            cursor.execute('''
+                UPDATE measurements
+                SET cast_id = (SELECT keep_id FROM cast_map WHERE old_id = measurements.cast_id)
+                WHERE cast_id IN (SELECT old_id FROM cast_map)
+            ''')
+            merged = cursor.execute('DELETE FROM casts WHERE cast_id IN (SELECT old_id FROM cast_map)').rowcount
+            if has_spatial_index(conn):
+                cursor.execute('DELETE FROM cast_positions WHERE id IN (SELECT old_id FROM cast_map)')
+            cursor.execute('DROP TABLE cast_map')
+            table, key = 'measurements', 'cast_id, Depth_bin'
+        else:
+            table, key = 'cast_data', 'Latitude, Longitude, Year, Month, Day, Cast_number, Depth_bin'
+
+        removed = cursor.execute(f'DELETE FROM {table} WHERE rowid NOT IN '
+                                 f'(SELECT MIN(rowid) FROM {table} GROUP BY {key})').rowcount
+
+        ensure_unique_keys(conn)
+        _rebuild_rollups(conn)
+        cursor.execute('COMMIT')
+
+        print(f"Removed {removed} duplicate rows and merged {merged} repeated casts.")
+        return removed
+
+    except Exception as e:
+        if conn and conn.in_transaction:
+            conn.rollback()
+        print(f"An error occurred: {e}")
+        return None
+
+    finally:
+        if conn:
+            conn.close()
+
+def migrate_to_normalized(db_file):
+    # Move an existing cast_data table into casts + measurements and replace it
+    # with a view of the same name, so query_data_by_date_range keeps working
+    conn = None
+    try:
+        conn = sqlite3.connect(db_file, isolation_level=None)
+        cursor = conn.cursor()
+
+        if is_normalized(conn):
+            print("Database is already normalized.")
+            return
+
+        cursor.execute(CREATE_TABLE_QUERY)
+        ensure_date_key(conn)
+        cursor.execute('BEGIN')
+        for statement in NORMALIZED_SCHEMA + DATE_INDEXES['casts'] + UNIQUE_INDEXES['casts']:
+            cursor.execute(statement)
+
+        # One cast per distinct cast number, position and date
+        keys = ', '.join(CAST_KEYS + ['Cast_number', 'Date_key'])
+        cursor.execute(f"INSERT INTO casts ({keys}) SELECT DISTINCT {keys} FROM cast_data")
+
+        # IS rather than = so rows with missing metadata still find their cast
+        match = ' AND '.join(f'c.{key} IS d.{key}' for key in CAST_KEYS + ['Cast_number'])
+        values = ', '.join(f'd.{column}' for column in MEASUREMENT_COLUMNS)
+        # Repeated depth bins from duplicate loads collapse onto the first copy
+        cursor.execute(f"INSERT INTO measurements (cast_id, {', '.join(MEASUREMENT_COLUMNS)}) "
+                       f"SELECT c.cast_id, {values} FROM cast_data d JOIN casts c ON {match} "
+                       f"WHERE true ON CONFLICT (cast_id, Depth_bin) DO NOTHING")
+
+        casts = cursor.execute('SELECT COUNT(*) FROM casts').fetchone()[0]
+        measurements = cursor.execute('SELECT COUNT(*) FROM measurements').fetchone()[0]
+        duplicates = cursor.execute('SELECT COUNT(*) FROM cast_data').fetchone()[0] - measurements
+
+        ensure_spatial_index(conn)
+
+        cursor.execute('DROP TABLE cast_data')
+        cursor.execute(CAST_DATA_VIEW)
+        if duplicates:
+            _rebuild_rollups(conn)
+        cursor.execute('COMMIT')
+
+        # Reclaim the space the repeated metadata used
+        cursor.execute('VACUUM')
+
+        print(f"Migrated {measurements} rows into {casts} casts.")
+
+    except Exception as e:
+        if conn and conn.in_transaction:
+            conn.rollback()
+        print(f"An error occurred: {e}")
+
+    finally:
+        if conn:
+            conn.close()
+
+def load_export(input_file, db_file, bin_size=10):
+    # Parse, bin and load one export without writing an intermediate CSV
+    from parser import iter_casts
+    from parserbybin import iter_binned_casts
+    return bulk_load(iter_binned_casts(iter_casts(input_file), bin_size), db_file)
+
 # Example usage
 '''
 csv_file = '/home/jpforbes/workspace/github.com/jpforbes5151/csvScraper/content/parsed/parsed_data_6.csv'  # Replace with the actual path to your CSV file
@@ -0,0 +1,221 @@
+import asyncio
+from collections import OrderedDict
+from datetime import date
+import numpy as np
+import matplotlib.pyplot as plt
+from ipywidgets import widgets
+from cubes import cube_size, draw_cubes
+from database import date_key, longitude_ranges
+from query_service import QueryService
+
+def _contains(outer, inner):
+    return outer[0] <= inner[0] and inner[1] <= outer[1]
+
+def covers(window, request):
+    # True when every row the request returns is also a row of the window's
+    # result. Groups are keyed by exact position, date and depth bin, so such rows
+    # are identical unless the new depth limit cuts through a bin.
+    if window['depth_bin_size'] != request['depth_bin_size']:
+        return False
+    if request['depth_limit'] != window['depth_limit'] and not (
+            request['depth_limit'] < window['depth_limit']
+            and request['depth_limit'] % request['depth_bin_size'] == 0):
+        return False
+    return (_contains(window['dates'], request['dates'])
+            and _contains(window['latitude'], request['latitude'])
+            and all(any(_contains(outer, inner) for outer in window['longitudes'])
+                    for inner in request['longitudes']))
+
+def filter_window(df, request):
+    # The request's rows out of a covering window's result, without SQLite
+    keys = df['Year'] * 10000 + df['Month'] * 100 + df['Day']
+    mask = keys.between(*request['dates']) & df['Latitude'].between(*request['latitude'])
+    mask &= np.logical_or.reduce([df['Longitude'].between(*lon_range) for lon_range in request['longitudes']])
+    mask &= df['Depth_bin'] < request['depth_limit']
+    return df[mask].reset_index(drop=True)
+
+class Explorer:
+    # Notebook explorer for the cube plot: date pickers, a latitude slider,
+    # longitude bounds (min east of max crosses the antimeridian), bin size and
+    # depth limit. Changes are debounced on the kernel's event loop, so queries,
+    # the QueryService connection and the figure all stay on the kernel thread;
+    # results of earlier windows that cover a new request are filtered in memory,
+    # misses go through a QueryService for a box padded by margin so small pans
+    # stay in memory; the one figure is redrawn in place.
+
+    def __init__(self, db_file, start_date='2000-01-01', end_date='2023-09-01', latitude=(50.0, 51.0),
+                 longitude=(-42.0, -40.0), depth_bin_size=100, depth_limit=1000, bin_sizes=(10, 50, 100, 500),
+                 debounce=0.3, margin=0.5, cache_windows=16):
+        self.service = QueryService(db_file)
+        self.debounce = debounce
+        self.margin = margin
+        self.cache_windows = cache_windows
+        self.windows = OrderedDict()
+        self.counts = {'filtered': 0, 'queried': 0}
+        self._pending = None
+
+        self.start_date = widgets.DatePicker(description='Start', value=date.fromisoformat(start_date))
+        self.end_date = widgets.DatePicker(description='End', value=date.fromisoformat(end_date))
+        self.latitude = widgets.FloatRangeSlider(description='Latitude', value=latitude, min=-90, max=90, step=0.1)
+        self.min_longitude = widgets.BoundedFloatText(description='Min lon', value=longitude[0], min=-180, max=180)
+        self.max_longitude = widgets.BoundedFloatText(description='Max lon', value=longitude[1], min=-180, max=180)
+        self.depth_bin_size = widgets.Dropdown(description='Bin (m)', options=list(bin_sizes), value=depth_bin_size)
+        self.depth_limit = widgets.IntSlider(description='Depth limit', value=depth_limit, min=100, max=10000,
+                                             step=100)
+        self.status = widgets.Label()
+        self.controls = [self.start_date, self.end_date, self.latitude, self.min_longitude, self.max_longitude,
+                         self.depth_bin_size, self.depth_limit]
+        for control in self.controls:
+            control.observe(self._on_change, names='value')
+
+        # One figure for the explorer's lifetime; each update swaps the cubes
+        self.fig = plt.figure(figsize=(10, 8))
+        self.ax = self.fig.add_subplot(111, projection='3d')
+        self.ax.set_xlabel('Latitude')
+        self.ax.set_ylabel('Longitude')
+        self.ax.set_zlabel('Depth (m)')
+        self.ax.set_box_aspect([1, 1, 1])
+        self.cmap = plt.get_cmap('coolwarm')
+        self.mappable = plt.cm.ScalarMappable(cmap=self.cmap, norm=plt.Normalize(0, 1))
+        self.mappable.set_array([])
+        self.fig.colorbar(self.mappable, ax=self.ax, label='Temperature (°C)')
+        self.cubes = None
+
+        # With the ipympl backend the canvas is itself a widget and redraws in
+        # place; otherwise the same figure is re-shown in an output area
+        self.live_canvas = isinstance(self.fig.canvas, widgets.DOMWidget)
+        if self.live_canvas:
+            self.view = self.fig.canvas
+        else:
+            plt.close(self.fig)
+            self.view = widgets.Output()
+
+    def request(self):
+        # Current control values, normalized as the queries compare them
+        return {
+            'start_date': str(self.start_date.value),
+            'end_date': str(self.end_date.value),
+            'dates': (date_key(self.start_date.value), date_key(self.end_date.value)),
+            'latitude': tuple(float(v) for v in self.latitude.value),
+            'min_longitude': float(self.min_longitude.value),
+            'max_longitude': float(self.max_longitude.value),
+            'longitudes': longitude_ranges(self.min_longitude.value, self.max_longitude.value),
+            'depth_bin_size': float(self.depth_bin_size.value),
+            'depth_limit': float(self.depth_limit.value),
+        }
+
+    def _padded(self, request):
+        # The request's box grown by margin on every side; a box that would run
+        # over the antimeridian is left as it is
+        low, high = request['latitude']
+        pad = (high - low) * self.margin
+        latitude = (max(low - pad, -90.0), min(high + pad, 90.0))
+        min_longitude, max_longitude = request['min_longitude'], request['max_longitude']
+        if min_longitude <= max_longitude:
+            pad = (max_longitude - min_longitude) * self.margin
+            min_longitude, max_longitude = max(min_longitude - pad, -180.0), min(max_longitude + pad, 180.0)
+        return dict(request, latitude=latitude, min_longitude=min_longitude, max_longitude=max_longitude,
+                    longitudes=longitude_ranges(min_longitude, max_longitude))
+
+    def fetch(self, request):
+        # Smallest cached window that covers the request
+        covering = [(len(df), key) for key, (window, df) in self.windows.items() if covers(window, request)]
+        if covering:
+            key = min(covering)[1]
+            self.windows.move_to_end(key)
+            self.counts['filtered'] += 1
+            return filter_window(self.windows[key][1], request)
+
+        window = self._padded(request)
+        df = self.service.query(window['start_date'], window['end_date'], *window['latitude'],
+                                window['min_longitude'], window['max_longitude'],
+                                window['depth_bin_size'], window['depth_limit'])
+        if df is None:
+            return None
+
+        self.counts['queried'] += 1
+        key = (window['dates'], window['latitude'], tuple(window['longitudes']),
+               window['depth_bin_size'], window['depth_limit'])
+        self.windows[key] = (window, df)
+        self.windows.move_to_end(key)
+        while len(self.windows) > self.cache_windows:
+            self.windows.popitem(last=False)
+        return filter_window(df, request)
+
+    def draw(self, df, request):
+        if self.cubes is not None:
+            self.cubes.remove()
+            self.cubes = None
+        self.ax.set_title(f"3D Plot of Temperature vs Depth ({request['start_date']} to {request['end_date']})")
+
+        if df is not None and not df.empty:
+            latitudes = df['Latitude'].to_numpy(dtype=np.float64)
+            longitudes = df['Longitude'].to_numpy(dtype=np.float64)
+            depths = df['Depth_bin'].to_numpy(dtype=np.float64)
+            temperatures = df['Temperature'].to_numpy(dtype=np.float64)
+
+            # Recolour the existing colorbar instead of adding another
+            self.mappable.set_clim(np.nanmin(temperatures), np.nanmax(temperatures))
+            size = cube_size(latitudes, longitudes, depths)
+            self.cubes = draw_cubes(self.ax, latitudes, longitudes, depths, temperatures,
+                                    (size / 100, size / 100, size / 0.5), self.cmap, self.mappable.norm)
+
+            self.ax.set_xlim(latitudes.min() - 0.15, latitudes.max() + 0.15)
+            self.ax.set_ylim(longitudes.min() + 0.15, longitudes.max() - 0.15)
+            self.ax.set_zlim(depths.max() + request['depth_bin_size'], depths.min())  # inverted depths
+
+        if self.live_canvas:
+            self.fig.canvas.draw_idle()
+        else:
+            from IPython.display import display
+            with self.view:
+                self.view.clear_output(wait=True)
+                display(self.fig)
+
+    def refresh(self):
+        request = self.request()
+        if request['dates'][0] > request['dates'][1] or request['latitude'][0] > request['latitude'][1]:
+            self.status.value = 'Start date must be before end date.'
+            return
+        df = self.fetch(request)
+        self.draw(df, request)
+        rows = 0 if df is None else len(df)
+        self.status.value = (f"{rows} bins ({self.counts['filtered']} from memory, "
+                             f"{self.counts['queried']} queries)")
+
+    def _on_change(self, change):
+        # Restart the timer on every change so a slider drag queries once, at the end
+        if self._pending is not None:
+            self._pending.cancel()
+            self._pending = None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop running (driven outside a kernel): refresh right away
+            self.refresh()
+            return
+        self._pending = loop.call_later(self.debounce, self.refresh)
+
+    def widget(self):
+        return widgets.VBox([widgets.HBox([widgets.VBox(self.controls[:4]), widgets.VBox(self.controls[4:])]),
+                             self.status, self.view])
+
+    def close(self):
+        if self._pending is not None:
+            self._pending.cancel()
+        self.service.close()
+        plt.close(self.fig)
+
+def explore(db_file, **kwargs):
+    # In a notebook cell: explore(db_file) shows the controls and the plot
+    from IPython.display import display
+    explorer = Explorer(db_file, **kwargs)
+    display(explorer.widget())
+    explorer.refresh()
+    return explorer
+
+
+# Example usage (in a notebook; %matplotlib widget gives in-place redraws)
+if __name__ == "__main__":
+    db_file = '/home/jpforbes/workspace/github.com/jpforbes5151/csvScraper/database/oceandata.db'
+    explore(db_file)
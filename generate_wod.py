@@ -0,0 +1,83 @@
+import random
+from parser import CAST_SEPARATOR
+
+# Column layouts seen in real exports; casts cycle through them so the parser
+# has to follow each cast's VARIABLES header
+LAYOUTS = [
+    ['Depth', 'Temperatur', 'Salinity'],
+    ['Depth', 'Temperatur', 'Salinity', 'Oxygen'],
+    ['Depth', 'Salinity', 'Temperatur'],
+    ['Depth', 'Temperatur', 'Salinity', 'Oxygen', 'pH'],
+]
+UNITS = {'Depth': 'm', 'Temperatur': 'degrees C', 'Salinity': 'PSS', 'Oxygen': 'umol/kg', 'pH': 'unitless'}
+
+def _format_value(value, decimals):
+    # WOD writes whole numbers with a trailing dot ('12.') and otherwise fixed decimals
+    if value == int(value):
+        return f'{int(value)}.'
+    return f'{value:.{decimals}f}'
+
+def _reading(name, depth, rng):
+    if name == 'Depth':
+        return depth
+    if name == 'Temperatur':
+        # Warm surface layer cooling towards ~2 C at depth
+        return round(2.0 + 14.0 * 2.718 ** (-depth / 400.0) + rng.gauss(0, 0.2), 3)
+    if name == 'Salinity':
+        return round(34.0 + 1.0 * (depth / (depth + 500.0)) + rng.gauss(0, 0.05), 3)
+    if name == 'Oxygen':
+        return round(250.0 - depth / 20.0 + rng.gauss(0, 5.0), 1)
+    return round(8.1 - depth / 10000.0 + rng.gauss(0, 0.02), 3)
+
+def _write_cast(file, cast_id, levels, rng, region, sentinel_rate):
+    min_lat, max_lat, min_lon, max_lon = region
+    layout = LAYOUTS[cast_id % len(LAYOUTS)]
+
+    file.write(CAST_SEPARATOR + '\n')
+    file.write(f"CAST                        ,,{cast_id:>14},WOD Unique Cast Number,WOD code\n")
+    file.write(f"NODC Cruise ID              ,,{'SYN-' + str(cast_id // 50):>14},\n")
+    file.write(f"Latitude                    ,,{rng.uniform(min_lat, max_lat):>14.4f},decimal degrees\n")
+    file.write(f"Longitude                   ,,{rng.uniform(min_lon, max_lon):>14.4f},decimal degrees\n")
+    file.write(f"Year                        ,,{rng.randint(1970, 2023):>14},\n")
+    file.write(f"Month                       ,,{rng.randint(1, 12):>14},\n")
+    file.write(f"Day                         ,,{rng.randint(1, 28):>14},\n")
+    file.write(f"Time                        ,,{rng.uniform(0, 24):>14.2f},decimal hours (UT)\n")
+    file.write("METADATA                    ,,              ,\n")
+
+    file.write('VARIABLES ,' + ''.join(f'{name:<11},F,O,' for name in layout) + '\n')
+    file.write('UNITS     ,' + ''.join(f'{UNITS[name]:<11}, , ,' for name in layout) + '\n')
+    file.write('Prof-Flag ,' + ''.join(f"{'':<11},0, ," for name in layout) + '\n')
+
+    depth = 0.0
+    for level in range(1, levels + 1):
+        fields = []
+        for name in layout:
+            if name != 'Depth' and rng.random() < sentinel_rate:
+                fields.append(f"{'---0---':>11},0, ,")
+            else:
+                fields.append(f"{_format_value(_reading(name, depth, rng), 3):>11},0, ,")
+        file.write(f'{level:>10},' + ''.join(fields) + '\n')
+        # Finer sampling near the surface, coarser at depth
+        depth += rng.choice([1.0, 2.0, 2.5, 5.0]) if depth < 200 else rng.choice([10.0, 20.0, 25.0, 50.0])
+
+    file.write('END OF VARIABLES SECTION,\n')
+
+def generate_export(output_file, casts=1000, levels=100, seed=0,
+                    region=(50.0, 51.0, -42.0, -40.0), sentinel_rate=0.01, first_cast=None):
+    # Write a synthetic ocldb-style export with the quirks of the real files:
+    # '---0---' sentinels, trailing-dot numbers, UNITS/Prof-Flag rows and
+    # differing VARIABLES layouts between casts. Cast numbers run from first_cast,
+    # by default seed * casts + 1, so files of the same size generated with
+    # different seeds don't share cast numbers and all load into one database.
+    rng = random.Random(seed)
+    if first_cast is None:
+        first_cast = seed * casts + 1
+    with open(output_file, 'w') as file:
+        for cast_id in range(first_cast, first_cast + casts):
+            _write_cast(file, cast_id, levels, rng, region, sentinel_rate)
+    return output_file
+
+
+# Example usage
+if __name__ == "__main__":
+    generate_export('./content/ocldb_synthetic.CTD.csv', casts=1000, levels=100)
@@ -3,91 +3,131 @@ import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 from mpl_toolkits.mplot3d import Axes3D
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from matplotlib.collections import LineCollection
+from cubes import draw_cubes
 from itertools import combinations  
 from itertools import product  
 
+# Column order of parsed matrices (parser.MATRIX_COLUMNS)
+MATRIX_COLUMNS = ['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Cast_number', 'Depth', 'Temperature', 'Salinity']
+CAST_KEYS = ['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Cast_number']
+
+# Decimated profiles with at most this many points keep their point markers
+MARKER_LIMIT = 2000
+
+## Level-of-detail helpers
+def profile_columns(matrix, variable):
+    # Depth, variable and a cast number per row from a DataFrame (parsed or binned),
+    # a NumPy array or a list of rows in MATRIX_COLUMNS order
+    if not isinstance(matrix, pd.DataFrame):
+        try:
+            array = np.asarray(matrix, dtype=np.float64)
+        except (TypeError, ValueError):
+            # Rows holding text are coerced column by column below
+            matrix = pd.DataFrame(np.asarray(matrix, dtype=object), columns=MATRIX_COLUMNS)
+        else:
+            # Numeric input: slice the columns directly instead of going through objects
+            depth = array[:, MATRIX_COLUMNS.index('Depth')]
+            values = array[:, MATRIX_COLUMNS.index(variable)]
+            keys = pd.DataFrame(array[:, [MATRIX_COLUMNS.index(key) for key in CAST_KEYS]])
+            casts = keys.groupby(list(keys.columns), sort=False, dropna=False).ngroup().to_numpy(dtype=np.int64)
+            return depth, values, casts
+    depth_column = 'Depth' if 'Depth' in matrix.columns else 'Depth_bin'
+
+    depth = pd.to_numeric(matrix[depth_column], errors='coerce').to_numpy(dtype=np.float64)
+    values = pd.to_numeric(matrix[variable], errors='coerce').to_numpy(dtype=np.float64)
+    if 'cast_index' in matrix.columns:
+        casts = matrix['cast_index'].to_numpy(dtype=np.int64)
+    else:
+        # Rows of one cast share position, date and cast number (query results have none)
+        keys = [key for key in CAST_KEYS if key in matrix.columns]
+        casts = matrix.groupby(keys, sort=False, dropna=False).ngroup().to_numpy(dtype=np.int64)
+    return depth, values, casts
+
+def minmax_decimate(depth, values, casts, buckets):
+    # Indices (in input order) of the rows to draw: the depth range is cut into
+    # buckets and every bucket of a cast keeps its first and last row and the rows
+    # with the smallest and largest value, so peaks and the line's path survive.
+    # The buckets are a budget for the whole plot, shared out between the casts,
+    # so about 4 * buckets rows are drawn however many casts are overlaid; past
+    # one cast per bucket every cast keeps its ends and extremes.
+    n = len(depth)
+    if n <= 4 * buckets:
+        return np.arange(n)
+
+    per_cast = max(buckets // len(np.unique(casts)), 1)
+    low, high = np.min(depth), np.max(depth)
+    span = (high - low) or 1.0
+    bucket = np.clip(((depth - low) / span * per_cast).astype(np.int64), 0, per_cast - 1)
+    keys = casts * per_cast + bucket
+
+    # Sorted by key then value: each group's first row is its minimum, last its maximum
+    by_value = np.lexsort((values, keys))
+    # Sorted by key only (stable): each group's first and last row in input order
+    by_position = np.argsort(keys, kind='stable')
+
+    sorted_keys = keys[by_position]
+    starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+    return np.unique(np.concatenate([by_value[starts], by_value[ends], by_position[starts], by_position[ends]]))
+
+def _profile_segments(depth, values, casts):
+    # One (value, depth) polyline per cast for a LineCollection
+    breaks = np.flatnonzero(casts[1:] != casts[:-1]) + 1
+    points = np.column_stack([values, depth])
+    return np.split(points, breaks)
+
+def plot_depth_profile(matrix, variable, label, color, title, buckets=None):
+    depth, values, casts = profile_columns(matrix, variable)
+
+    # Rows without a reading leave nothing to draw
+    keep = ~(np.isnan(depth) | np.isnan(values))
+    depth, values, casts = depth[keep], values[keep], casts[keep]
+
+    fig, ax = plt.subplots(figsize=(10, 6))
+    # One bucket per pixel of axis height unless told otherwise
+    buckets = buckets or max(int(ax.bbox.height), 1)
+    rows = minmax_decimate(depth, values, casts, buckets)
+    depth, values, casts = depth[rows], values[rows], casts[rows]
+
+    if len(np.unique(casts)) > 1:
+        # Many casts: one artist for all of them instead of a line per cast
+        ax.add_collection(LineCollection(_profile_segments(depth, values, casts), colors=color, linewidths=0.8))
+        ax.autoscale_view()
+    else:
+        ax.plot(values, depth, marker='o' if len(rows) <= MARKER_LIMIT else None, linestyle='-', color=color)
+
+    ax.set_xlabel(label)
+    ax.set_ylabel('Depth (m)')
+    ax.set_title(title)
+    ax.invert_yaxis()  # Invert the y-axis to show depth increasing downwards
+    return fig
+
 ## Visualization functions
-def plot_depth_vs_temperature(matrix):
-    # print what is received
-    print("Received Matrix:")
-    print(matrix)
-
-    df = pd.DataFrame(matrix, columns=['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Depth', 'Temperature', 'Salinity'])
-    
-    #test frame output
-    print("this is the data frame when generated:")
-    print(df)
-
-    #convert Depth and Temperature columns to numeric values
-    df['Depth'] = pd.to_numeric(df['Depth'])
-    df['Temperature'] = pd.to_numeric(df['Temperature'])
-
-    #make the plot
-    plt.figure(figsize=(10, 6))
-    plt.plot(df['Temperature'], df['Depth'], marker='o', linestyle='-', color='b')
-    plt.xlabel('Temperature (°C)')
-    plt.ylabel('Depth (m)')
-    plt.title('Depth vs Temperature')
-    plt.gca().invert_yaxis()  # Invert the y-axis to show depth increasing downwards
+def plot_depth_vs_temperature(matrix, buckets=None):
+    # matrix may be a DataFrame, a NumPy array or a list of rows; large inputs are
+    # decimated to what the plot can show, many casts are drawn as one collection
+    plot_depth_profile(matrix, 'Temperature', 'Temperature (°C)', 'b', 'Depth vs Temperature', buckets)
     #plt.gca().invert_xaxis()  # Invert the x-axis to show depth decreasing from left to right
     plt.show()
-    print("this is the data frame after generating the plot:", df)
-
-def plot_depth_vs_salinity(matrix):
-    df = pd.DataFrame(matrix, columns=['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Depth', 'Temperature', 'Salinity'])
-    df['Depth'] = pd.to_numeric(df['Depth'])
-    df['Salinity'] = pd.to_numeric(df['Salinity'])
-
-    plt.figure(figsize=(10, 6))
-    plt.plot(df['Salinity'], df['Depth'], marker='o', linestyle='-', color='g')
-    plt.xlabel('Salinity (PSS)')
-    plt.ylabel('Depth (m)')
-    plt.title('Depth vs Salinity')
-    plt.gca().invert_yaxis()  # Invert the y-axis to show depth increasing downwards
+
+def plot_depth_vs_salinity(matrix, buckets=None):
+    plot_depth_profile(matrix, 'Salinity', 'Salinity (PSS)', 'g', 'Depth vs Salinity', buckets)
     #plt.gca().invert_xaxis()  # Invert the x-axis to show depth decreasing from left to right
     plt.show()
 
 def plot_temperature_cubes(matrix):
     # Extracting data
-    latitudes = np.array([row[0] for row in matrix])
-    longitudes = np.array([row[1] for row in matrix])
-    depths = np.array([row[5] for row in matrix])
-    temperatures = np.array([row[6] for row in matrix])
+    matrix = np.asarray(matrix, dtype=np.float64)
+    latitudes = matrix[:, 0]
+    longitudes = matrix[:, 1]
+    depths = matrix[:, 6]
+    temperatures = matrix[:, 7]
 
     # Create figure and 3D axis
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111, projection='3d')
 
-    # Function to draw cube at each data point
-    def draw_cube(x, y, z, size, color, ax):
-        # Define vertices of the cube
-        vertices = np.array([
-            [x - size, y - size, z - size],
-            [x + size, y - size, z - size],
-            [x + size, y + size, z - size],
-            [x - size, y + size, z - size],
-            [x - size, y - size, z + size],
-            [x + size, y - size, z + size],
-            [x + size, y + size, z + size],
-            [x - size, y + size, z + size]
-        ])
-
-        # Define faces of the cube
-        faces = [
-            [vertices[0], vertices[1], vertices[2], vertices[3]],
-            [vertices[4], vertices[5], vertices[6], vertices[7]],
-            [vertices[0], vertices[1], vertices[5], vertices[4]],
-            [vertices[2], vertices[3], vertices[7], vertices[6]],
-            [vertices[0], vertices[3], vertices[7], vertices[4]],
-            [vertices[1], vertices[2], vertices[6], vertices[5]]
-        ]
-
-        # Convert faces to Poly3DCollection
-        cube = Poly3DCollection(faces, linewidths=1, edgecolors='k', alpha=0.5)
-        cube.set_facecolor(color)  # Set face color
-        ax.add_collection3d(cube)
-
     # Normalize temperature values to range [0, 1] for colormap
     norm = plt.Normalize(temperatures.min(), temperatures.max())
 
@@ -95,9 +135,7 @@ def plot_temperature_cubes(matrix):
     cmap = plt.get_cmap('coolwarm')
 
     # Plot cubes at each data point with color corresponding to temperature
-    for lat, lon, depth, temp in zip(latitudes, longitudes, depths, temperatures):
-        color = cmap(norm(temp))
-        draw_cube(lat, lon, depth, size=1, color=color, ax=ax)
+    draw_cubes(ax, latitudes, longitudes, depths, temperatures, 1, cmap, norm)
 
     # Set labels and title
     ax.set_xlabel('Latitude')
@@ -137,10 +175,10 @@ def read_csv_without_header(file_path):
 #testing with explicit data:
 '''
 test_matrix = [
-    [44.565, -63.9917, 1969, 7, 2, 9.92, 14.9, 31.23],
-    [44.565, -63.9917, 1969, 7, 2, 19.84, 5, 31.34],
-    [44.565, -63.9917, 1969, 7, 2, 29.76, 3.8, 31.5],
-    [44.565, -63.9917, 1969, 7, 2, 49.59, 3.6, 31.53]
+    [44.565, -63.9917, 1969, 7, 2, 1, 9.92, 14.9, 31.23],
+    [44.565, -63.9917, 1969, 7, 2, 1, 19.84, 5, 31.34],
+    [44.565, -63.9917, 1969, 7, 2, 1, 29.76, 3.8, 31.5],
+    [44.565, -63.9917, 1969, 7, 2, 1, 49.59, 3.6, 31.53]
 ]
 plot_depth_vs_temperature(test_matrix)
 '''
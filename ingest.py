@@ -0,0 +1,117 @@
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from parser import CAST_SEPARATOR, VARIABLE_KEYS, iter_casts, create_matrix, write_to_csv
+
+# Files larger than this are split at cast boundaries across workers
+SPLIT_SIZE = 256 * 1024 * 1024
+
+def find_input_files(source, pattern='ocldb*.csv'):
+    # source may be a directory, a glob pattern, a single file or a list of files
+    if isinstance(source, (list, tuple)):
+        return sorted(source)
+    if os.path.isdir(source):
+        source = os.path.join(source, pattern)
+    return sorted(glob.glob(source))
+
+def split_at_casts(file_path, split_size=SPLIT_SIZE):
+    # Return (start, end) byte ranges that each begin on a cast separator line
+    size = os.path.getsize(file_path)
+    if size <= split_size:
+        return [(0, size)]
+
+    separator = CAST_SEPARATOR.encode()
+    boundaries = [0]
+
+    with open(file_path, 'rb') as file:
+        for target in range(split_size, size, split_size):
+            if target <= boundaries[-1]:
+                continue
+            file.seek(target)
+            # Skip the (probably partial) line we landed in
+            file.readline()
+            position = file.tell()
+            line = file.readline()
+            while line and not line.startswith(separator):
+                position = file.tell()
+                line = file.readline()
+            if not line:
+                break
+            boundaries.append(position)
+
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _parse_range(task):
+    # Worker entry point: parse one byte range of one file into a matrix
+    file_path, start, end, variables = task
+    started = time.perf_counter()
+    casts = list(iter_casts(file_path, variables, start, end))
+    matrix = create_matrix(casts, variables=variables)
+    elapsed = time.perf_counter() - started
+    return matrix, len(casts), end - start, elapsed
+
+def ingest_files(source, variables=VARIABLE_KEYS, max_workers=None, split_size=SPLIT_SIZE, stats=None):
+    # Parse every matched file in a process pool and yield one matrix DataFrame per
+    # file, in sorted file order regardless of which worker finishes first.
+    # Per-file throughput is printed and, if a list is passed as stats, appended to it.
+    files = find_input_files(source)
+    if not files:
+        print(f"No input files found for {source}")
+        return
+
+    tasks = []
+    for file_path in files:
+        for start, end in split_at_casts(file_path, split_size):
+            tasks.append((file_path, start, end, variables))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        # map keeps results in task order, so parts come back grouped by file
+        results = executor.map(_parse_range, tasks)
+
+        current = None
+        parts = []
+        file_stats = None
+
+        for task, (matrix, casts, size, elapsed) in zip(tasks, results):
+            file_path = task[0]
+            if file_path != current:
+                if current is not None:
+                    yield _finish_file(parts, file_stats, stats)
+                current = file_path
+                parts = []
+                file_stats = {'file': file_path, 'casts': 0, 'rows': 0, 'bytes': 0, 'seconds': 0.0}
+
+            parts.append(matrix)
+            file_stats['casts'] += casts
+            file_stats['rows'] += len(matrix)
+            file_stats['bytes'] += size
+            file_stats['seconds'] += elapsed
+
+        if current is not None:
+            yield _finish_file(parts, file_stats, stats)
+
+def _finish_file(parts, file_stats, stats):
+    seconds = file_stats['seconds']
+    megabytes = file_stats['bytes'] / (1024 * 1024)
+    file_stats['rows_per_sec'] = file_stats['rows'] / seconds if seconds else 0.0
+    file_stats['mb_per_sec'] = megabytes / seconds if seconds else 0.0
+
+    print(f"{file_stats['file']}: {file_stats['casts']} casts, {file_stats['rows']} rows, "
+          f"{megabytes:.1f} MB in {seconds:.2f}s ({file_stats['mb_per_sec']:.1f} MB/s, "
+          f"{file_stats['rows_per_sec']:.0f} rows/s)")
+
+    if stats is not None:
+        stats.append(file_stats)
+
+    return pd.concat(parts, ignore_index=True)
+
+
+# Example usage
+if __name__ == "__main__":
+    input_dir = './content/'
+    output_file = './content/parsed/parsed_data.csv'
+
+    write_to_csv(ingest_files(input_dir), output_file)
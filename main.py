@@ -3,21 +3,56 @@ import math
 from datetime import datetime
 import numpy as np
 import matplotlib.pyplot as plt
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 import sqlite3
 import pandas as pd
-from ipywidgets import widgets, interact
-
-# Function to query data by date range
-def query_data_by_date_range(db_file, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude, depth_bin_size=100, depth_limit = 10000):
-    try:
-        # Connect to the SQLite database
-        conn = sqlite3.connect(db_file)
-        cursor = conn.cursor()
-
-        # num_bins = math.ceil(5000 / depth_bin_size)  # Assuming the maximum depth is 5000m
-
-        # Prepare the SQL query with depth binning
+import querylog
+from cubes import cube_size, draw_cubes
+from database import date_key, has_spatial_index, longitude_ranges, rollup_sizes, rollup_table
+
+def describe_database(conn):
+    # Which optional structures this database has; decides how queries are built
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(cast_data)')]
+    return {
+        'date_key': 'Date_key' in columns,
+        'rollups': rollup_sizes(conn),
+        'spatial': has_spatial_index(conn),
+    }
+
+def build_query(schema, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude, depth_bin_size=100, depth_limit=10000, partial=False):
+    # Return (sql, params) for a date range / bounding box query against a database
+    # described by describe_database. partial=True returns Temperature_sum and
+    # Temperature_count instead of the average, for results that are merged with
+    # other databases' before dividing (see shards.query_shards).
+    # Use the indexed Date_key column when the database has one; older
+    # databases fall back to building the date string for every row
+    if schema['date_key']:
+        date_filter = 'Date_key BETWEEN ? AND ?'
+        date_params = (date_key(start_date), date_key(end_date))
+    else:
+        date_filter = "(Year || '-' || printf('%02d', Month) || '-' || printf('%02d', Day)) BETWEEN ? AND ?"
+        date_params = (str(start_date), str(end_date))
+
+    # Typed bounds; a box with min_longitude > max_longitude crosses the antimeridian
+    latitude_range = (float(min_latitude), float(max_latitude))
+    lon_ranges = longitude_ranges(min_longitude, max_longitude)
+    lon_filter = ' OR '.join('Longitude BETWEEN ? AND ?' for _ in lon_ranges)
+    lon_params = tuple(bound for lon_range in lon_ranges for bound in lon_range)
+
+    # A rollup table at this resolution answers the query from pre-aggregated
+    # sums and counts. The depth limit must fall on a bin edge for the rollup's
+    # bins to contain exactly the rows the base query would average.
+    use_rollup = (
+        schema['date_key']
+        and float(depth_bin_size).is_integer()
+        and int(depth_bin_size) in schema['rollups']
+        and float(depth_limit) % float(depth_bin_size) == 0
+    )
+
+    if use_rollup:
+        if partial:
+            temperature = 'Temperature_sum, Temperature_count'
+        else:
+            temperature = 'Temperature_sum / Temperature_count AS Temperature'
         query = f'''
         SELECT
             Latitude,
@@ -25,31 +60,171 @@ def query_data_by_date_range(db_file, start_date, end_date, min_latitude, max_la
             Year,
             Month,
             Day,
-            (CAST(Depth_bin / {depth_bin_size} AS INTEGER) * {depth_bin_size}) AS Depth_bin,  -- Binning depth into 100m increments
-            AVG(Temperature) as Temperature
-        FROM 
-            cast_data
-        WHERE 
-            (Year || '-' || printf('%02d', Month) || '-' || printf('%02d', Day)) BETWEEN ? AND ?
-            AND Latitude BETWEEN ? AND ?
-            AND Longitude BETWEEN ? AND ?
-            AND Depth_bin < {depth_limit}
-        GROUP BY
-            Latitude, Longitude, Year, Month, Day, (CAST(Depth_bin / {depth_bin_size} AS INTEGER) * {depth_bin_size});
+            Depth_bin,
+            {temperature}
+        FROM
+            {rollup_table(depth_bin_size)}
+        WHERE
+            Date_key BETWEEN ? AND ?
+            AND Latitude BETWEEN ? AND ? AND ({lon_filter})
+            AND Depth_bin < ?
+        ORDER BY
+            Latitude, Longitude, Year, Month, Day, Depth_bin;
         '''
-        # Execute the query with parameters
-        cursor.execute(query, (start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude))
-        
-        # Fetch all results
+        return query, date_params + latitude_range + lon_params + (float(depth_limit),)
+
+    if schema['spatial']:
+        # The R*Tree picks the casts inside the box and only their measurements are
+        # joined. It stores 32-bit bounds, so the exact comparison on casts drops
+        # any false positives at the edges.
+        boxes = ' UNION ALL '.join(
+            'SELECT id FROM cast_positions WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?'
+            for _ in lon_ranges)
+        source = 'casts c JOIN measurements m ON m.cast_id = c.cast_id'
+        position_filter = f'c.cast_id IN ({boxes}) AND Latitude BETWEEN ? AND ? AND ({lon_filter})'
+        position_params = tuple(bound for lon_range in lon_ranges for bound in latitude_range + lon_range)
+        position_params += latitude_range + lon_params
+    else:
+        source = 'cast_data'
+        position_filter = f'Latitude BETWEEN ? AND ? AND ({lon_filter})'
+        position_params = latitude_range + lon_params
+
+    if partial:
+        temperature = 'TOTAL(Temperature) AS Temperature_sum, COUNT(Temperature) AS Temperature_count'
+    else:
+        temperature = 'AVG(Temperature) as Temperature'
+
+    # num_bins = math.ceil(5000 / depth_bin_size)  # Assuming the maximum depth is 5000m
+
+    # Prepare the SQL query with depth binning
+    query = f'''
+    SELECT
+        Latitude,
+        Longitude,
+        Year,
+        Month,
+        Day,
+        (CAST(Depth_bin / {depth_bin_size} AS INTEGER) * {depth_bin_size}) AS Depth_bin,  -- Binning depth into 100m increments
+        {temperature}
+    FROM 
+        {source}
+    WHERE 
+        {date_filter}
+        AND {position_filter}
+        AND Depth_bin < ?
+    GROUP BY
+        Latitude, Longitude, Year, Month, Day, (CAST(Depth_bin / {depth_bin_size} AS INTEGER) * {depth_bin_size});
+    '''
+    return query, date_params + position_params + (float(depth_limit),)
+
+def run_query(conn, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude, depth_bin_size=100, depth_limit=10000, schema=None, partial=False):
+    # Run a date range query on an open connection and return a DataFrame
+    if schema is None:
+        schema = describe_database(conn)
+    query, params = build_query(schema, start_date, end_date, min_latitude, max_latitude,
+                                min_longitude, max_longitude, depth_bin_size, depth_limit, partial)
+
+    # Timed per phase when querylog is enabled
+    profile = querylog.start_query(conn, query, params)
+
+    # Execute the query with parameters
+    cursor = conn.cursor()
+    with profile.phase('sql'):
+        cursor.execute(query, params)
+
+    # Fetch all results
+    with profile.phase('fetch'):
         rows = cursor.fetchall()
 
+    with profile.phase('frame'):
         # Get column names
         column_names = [description[0] for description in cursor.description]
 
         # Convert the results to a DataFrame
         df = pd.DataFrame(rows, columns=column_names)
 
-        return df
+    profile.finish(len(df))
+    return profile.tag(df)
+
+# Result column types for the chunked readers; anything else comes back as float64
+RESULT_DTYPES = {
+    'Latitude': np.float64,
+    'Longitude': np.float64,
+    'Year': np.int64,
+    'Month': np.int64,
+    'Day': np.int64,
+    'Depth_bin': np.float64,
+    'Temperature': np.float64,
+}
+
+def _typed_column(values, name):
+    try:
+        return np.array(values, dtype=RESULT_DTYPES.get(name, np.float64))
+    except (TypeError, ValueError):
+        # NULLs in an integer column: fall back to float so they become NaN
+        return np.array(values, dtype=np.float64)
+
+def iter_query_chunks(conn, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude, depth_bin_size=100, depth_limit=10000, chunk_size=50000, schema=None):
+    # Yield the query result as {column: NumPy array} chunks of at most chunk_size
+    # rows via fetchmany, so large extracts can be consumed or reduced incrementally
+    if schema is None:
+        schema = describe_database(conn)
+    query, params = build_query(schema, start_date, end_date, min_latitude, max_latitude,
+                                min_longitude, max_longitude, depth_bin_size, depth_limit)
+    profile = querylog.start_query(conn, query, params)
+    cursor = conn.cursor()
+    with profile.phase('sql'):
+        cursor.execute(query, params)
+    column_names = [description[0] for description in cursor.description]
+
+    total = 0
+    while True:
+        with profile.phase('fetch'):
+            rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        with profile.phase('frame'):
+            chunk = {name: _typed_column(values, name) for name, values in zip(column_names, zip(*rows))}
+        total += len(rows)
+        yield chunk
+    profile.finish(total)
+
+def query_to_frame(conn, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude, depth_bin_size=100, depth_limit=10000, chunk_size=50000, expected_rows=None, schema=None):
+    # Like run_query, but fills preallocated typed column arrays chunk by chunk instead
+    # of collecting every row as a tuple first. Capacity starts at expected_rows (or
+    # one chunk) and doubles as needed; the arrays are trimmed and wrapped without copying.
+    capacity = expected_rows or chunk_size
+    columns = None
+    filled = 0
+
+    for chunk in iter_query_chunks(conn, start_date, end_date, min_latitude, max_latitude, min_longitude,
+                                   max_longitude, depth_bin_size, depth_limit, chunk_size, schema):
+        n = len(next(iter(chunk.values())))
+        if columns is None:
+            columns = {name: np.empty(capacity, dtype=values.dtype) for name, values in chunk.items()}
+        if filled + n > capacity:
+            capacity = max(capacity * 2, filled + n)
+            for name in columns:
+                columns[name] = np.resize(columns[name], capacity)
+        for name, values in chunk.items():
+            if values.dtype != columns[name].dtype:
+                # An integer column met a NULL in a later chunk
+                columns[name] = columns[name].astype(np.float64)
+            columns[name][filled:filled + n] = values
+        filled += n
+
+    if columns is None:
+        return pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in RESULT_DTYPES.items()})
+    return pd.DataFrame({name: values[:filled] for name, values in columns.items()}, copy=False)
+
+# Function to query data by date range
+def query_data_by_date_range(db_file, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude, depth_bin_size=100, depth_limit = 10000):
+    conn = None
+    try:
+        # Connect to the SQLite database
+        conn = sqlite3.connect(db_file)
+        return run_query(conn, start_date, end_date, min_latitude, max_latitude,
+                         min_longitude, max_longitude, depth_bin_size, depth_limit)
 
     except Exception as e:
         print(f"An error occurred: {e}")
@@ -60,69 +235,44 @@ def query_data_by_date_range(db_file, start_date, end_date, min_latitude, max_la
         if conn:
             conn.close()
 
-# Function to plot temperature cubes
-def plot_temperature_cubes(df):
+# Function to draw temperature cubes onto a new figure (no plt.show, so it also
+# works headless, see batch_render.py)
+def draw_temperature_cubes(df, start_date=None, end_date=None, depth_bin_size=None):
+    # start_date/end_date only label the plot and default to the dates in df;
+    # depth_bin_size pads the depth axis and defaults to the spacing of the bins
+    render = querylog.start_render(df)
+
     # Extracting data
-    latitudes = df['Latitude'].values
-    longitudes = df['Longitude'].values
-    depths = df['Depth_bin'].values
-    temperatures = df['Temperature'].values
+    latitudes = df['Latitude'].to_numpy(dtype=np.float64)
+    longitudes = df['Longitude'].to_numpy(dtype=np.float64)
+    depths = df['Depth_bin'].to_numpy(dtype=np.float64)
+    temperatures = df['Temperature'].to_numpy(dtype=np.float64)
+
+    if start_date is None or end_date is None:
+        dates = pd.to_datetime(df[['Year', 'Month', 'Day']], errors='coerce')
+        start_date = start_date or dates.min().date()
+        end_date = end_date or dates.max().date()
+    if depth_bin_size is None:
+        steps = np.diff(np.unique(depths))
+        depth_bin_size = steps.min() if len(steps) else 0
 
     # Create figure and 3D axis
     fig = plt.figure(figsize=(10, 8))
     ax = fig.add_subplot(111, projection='3d')
 
-    # Function to draw cube at each data point
-    def draw_cube(x, y, z, size, color, ax):
-        # Define vertices of the cube
-        scale_x = 100
-        scale_y = 100
-        scale_z = 0.5
-        vertices = np.array([
-            [x - size/scale_x, y - size/scale_y, z - size/scale_z],
-            [x + size/scale_x, y - size/scale_y, z - size/scale_z],
-            [x + size/scale_x, y + size/scale_y, z - size/scale_z],
-            [x - size/scale_x, y + size/scale_y, z - size/scale_z],
-            [x - size/scale_x, y - size/scale_y, z + size/scale_z],
-            [x + size/scale_x, y - size/scale_y, z + size/scale_z],
-            [x + size/scale_x, y + size/scale_y, z + size/scale_z],
-            [x - size/scale_x, y + size/scale_y, z + size/scale_z]
-        ])
-
-        # Define faces of the cube
-        faces = [
-            [vertices[0], vertices[1], vertices[2], vertices[3]],
-            [vertices[4], vertices[5], vertices[6], vertices[7]],
-            [vertices[0], vertices[1], vertices[5], vertices[4]],
-            [vertices[2], vertices[3], vertices[7], vertices[6]],
-            [vertices[0], vertices[3], vertices[7], vertices[4]],
-            [vertices[1], vertices[2], vertices[6], vertices[5]]
-        ]
-
-        # Convert faces to Poly3DCollection
-        cube = Poly3DCollection(faces, linewidths=1, edgecolors='k', alpha=0.5)
-        cube.set_facecolor(color)  # Set face color
-        ax.add_collection3d(cube)
-
     # Normalize temperature values to range [0, 1] for colormap
-    norm = plt.Normalize(temperatures.min(), temperatures.max())
+    norm = plt.Normalize(np.nanmin(temperatures), np.nanmax(temperatures))
 
     # Create colormap
     cmap = plt.get_cmap('coolwarm')
 
-    # Calculate distances between adjacent data points
-    distances = np.sqrt(np.diff(latitudes)**2 + np.diff(longitudes)**2 + np.diff(depths)**2)
-
-    # Find minimum distance
-    min_distance = np.min(distances)
-
-    # Set cube size to half of the minimum distance
-    cube_size = min_distance / 10
+    # Cube size is a tenth of the smallest distance between adjacent data points;
+    # the scale divisors stretch it to suit degrees across and metres down
+    size = cube_size(latitudes, longitudes, depths)
+    half_size = (size / 100, size / 100, size / 0.5)
 
     # Plot cubes at each data point with color corresponding to temperature
-    for lat, lon, depth, temp in zip(latitudes, longitudes, depths, temperatures):
-        color = cmap(norm(temp))
-        draw_cube(lat, lon, depth, size=cube_size, color=color, ax=ax)
+    draw_cubes(ax, latitudes, longitudes, depths, temperatures, half_size, cmap, norm)
 
     # Set labels and title
     ax.set_xlabel('Latitude')
@@ -134,9 +284,9 @@ def plot_temperature_cubes(df):
     ax.invert_zaxis()
 
     # Set axis limits
-    ax.set_xlim(min(latitudes) - 0.15, max(latitudes) + 0.15)
-    ax.set_ylim(min(longitudes) + 0.15, max(longitudes) - 0.15)
-    ax.set_zlim(max(depths) + depth_bin_size, min(depths))  # inverted depths
+    ax.set_xlim(latitudes.min() - 0.15, latitudes.max() + 0.15)
+    ax.set_ylim(longitudes.min() + 0.15, longitudes.max() - 0.15)
+    ax.set_zlim(depths.max() + depth_bin_size, depths.min())  # inverted depths
 
     # Set aspect ratio
     ax.set_box_aspect([1, 1, 1])  # Equal aspect ratio
@@ -145,7 +295,12 @@ def plot_temperature_cubes(df):
     sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
     sm.set_array([])
     fig.colorbar(sm, ax=ax, label='Temperature (°C)')
+    render.finish()
+    return fig
 
+# Function to plot temperature cubes
+def plot_temperature_cubes(df, start_date=None, end_date=None, depth_bin_size=None):
+    draw_temperature_cubes(df, start_date, end_date, depth_bin_size)
     plt.show()
 
 
@@ -166,10 +321,10 @@ if __name__ == "__main__":
     # explicitly state the start and end date
     start_date = '2000-01-01'
     end_date = '2023-09-01'
-    min_latitude = '50'
-    max_latitude = '51'
-    min_longitude = '-42'
-    max_longitude =  '-40'
+    min_latitude = 50.0
+    max_latitude = 51.0
+    min_longitude = -42.0
+    max_longitude = -40.0
 
     ## --------------- OVERRIDE DEFAULT PARAMS ------------------
     #Depth bin size
@@ -193,12 +348,12 @@ if __name__ == "__main__":
         end_date_str = end_date.strftime('%Y-%m-%d')
 
         # Ensure latitude range is input correctly
-        if int(min_latitude) > int(max_latitude):
+        if float(min_latitude) > float(max_latitude):
             raise ValueError("The Minimum Latitude must be larger than the Maximum Latitude being input.")
 
-        # Ensure longitude range is input correctly
-        if int(min_longitude) > int(max_longitude):
-            raise ValueError("The Minimum Longitude must be larger than the Maximum Longitude being input.")
+        # A minimum longitude east of the maximum is a box across the antimeridian
+        if not (-180 <= float(min_longitude) <= 180 and -180 <= float(max_longitude) <= 180):
+            raise ValueError("Longitudes must be between -180 and 180.")
 
         
 
@@ -208,7 +363,7 @@ if __name__ == "__main__":
             print("Query Results:")
             print(result_df)
             # Plot the results
-            plot_temperature_cubes(result_df)
+            plot_temperature_cubes(result_df, start_date_str, end_date_str, depth_bin_size)
         else:
             print("No data found for the given date range.")
 
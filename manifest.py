@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from ingest import find_input_files, ingest_files
+from parserbybin import bin_and_average, write_to_csv
+from database import create_and_populate_db
+
+MANIFEST_FILE = './content/parsed/manifest.json'
+
+def load_manifest(manifest_file=MANIFEST_FILE):
+    if not os.path.exists(manifest_file):
+        return {}
+    with open(manifest_file, 'r') as file:
+        return json.load(file)
+
+def save_manifest(manifest, manifest_file=MANIFEST_FILE):
+    # Write to a temp file first so an interrupted run never leaves a torn manifest
+    temp_file = manifest_file + '.tmp'
+    with open(temp_file, 'w') as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(temp_file, manifest_file)
+
+def content_hash(file_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def is_unchanged(file_path, manifest):
+    # Cheap size/mtime check first; only hash when those differ (e.g. after a copy)
+    entry = manifest.get(os.path.abspath(file_path))
+    if entry is None:
+        return False
+
+    stat = os.stat(file_path)
+    if entry['size'] != stat.st_size:
+        return False
+    if entry['mtime'] == stat.st_mtime:
+        return True
+
+    if entry['hash'] != content_hash(file_path):
+        return False
+
+    # Same bytes with a new mtime: remember it so the next run skips the hash
+    entry['mtime'] = stat.st_mtime
+    return True
+
+def pending_files(source, manifest):
+    # New or changed input files that still need to be processed
+    return [f for f in find_input_files(source) if not is_unchanged(f, manifest)]
+
+def record_file(manifest, file_path, casts, output_file):
+    stat = os.stat(file_path)
+    manifest[os.path.abspath(file_path)] = {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'hash': content_hash(file_path),
+        'casts': casts,
+        'output': output_file,
+        'processed': datetime.now().isoformat(timespec='seconds')
+    }
+
+def update_incremental(source, output_dir, db_file=None, manifest_file=MANIFEST_FILE):
+    # Parse, bin and (optionally) load only the inputs the manifest hasn't seen
+    manifest = load_manifest(manifest_file)
+    files = pending_files(source, manifest)
+
+    if not files:
+        print("All input files are up to date.")
+        save_manifest(manifest, manifest_file)
+        return []
+
+    print(f"{len(files)} new or changed input file(s) to process")
+
+    stats = []
+    processed = []
+    for file_path, matrix in zip(files, ingest_files(files, stats=stats)):
+        binned = bin_and_average(matrix)
+
+        # One output per input file, replaced rather than timestamped on rerun
+        base = os.path.splitext(os.path.basename(file_path))[0]
+        output_file = os.path.join(output_dir, f'{base}_binned.csv')
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        output_file = write_to_csv(binned, output_file)
+
+        if db_file is not None:
+            # A changed file that was loaded before carries corrected readings for
+            # casts already stored, so those overwrite rather than get skipped
+            on_conflict = 'replace' if os.path.abspath(file_path) in manifest else 'skip'
+            # None means the load failed; leave the file out of the manifest so the
+            # next run tries it again
+            if create_and_populate_db(output_file, db_file, on_conflict=on_conflict) is None:
+                print(f"Loading {file_path} into {db_file} failed; it will be retried on the next run.")
+                continue
+
+        record_file(manifest, file_path, stats[-1]['casts'], output_file)
+        save_manifest(manifest, manifest_file)
+        processed.append(file_path)
+
+    return processed
+
+
+# Example usage
+if __name__ == "__main__":
+    input_dir = './content/'
+    output_dir = './content/parsed/'
+    db_file = './database/oceandata.db'
+
+    update_incremental(input_dir, output_dir, db_file)
@@ -1,21 +1,88 @@
 import csv
 import os
 from datetime import datetime
+from itertools import islice
+import numpy as np
 import pandas as pd
 
-def parse_casts(file_path):
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-
-    casts = []
+METADATA_KEYS = ['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Cast_number']
+DATE_KEYS = ['Year', 'Month', 'Day']
+# Metadata stored under a different label in the export: WOD's unique cast number
+METADATA_LABELS = {'Cast_number': 'CAST'}
+# Metadata kept integral unless a cast is missing it
+INTEGER_KEYS = DATE_KEYS + ['Cast_number']
+VARIABLE_KEYS = ['Depth', 'Temperature', 'Salinity']
+MATRIX_COLUMNS = METADATA_KEYS + VARIABLE_KEYS
+SENTINEL = '---0---'
+
+# WOD truncates variable names to ten characters in the VARIABLES header
+VARIABLE_ALIASES = {
+    'Temperatur': 'Temperature',
+    'Chlorophyl': 'Chlorophyll',
+}
+
+CAST_SEPARATOR = "#--------------------------------------------------------------------------------"
+
+# Extractors compiled per (VARIABLES header, requested variables) so casts sharing
+# a column layout reuse the same one
+_extractor_cache = {}
+
+def compile_extractor(header_line, variables=VARIABLE_KEYS):
+    key = (header_line, tuple(variables))
+    extractor = _extractor_cache.get(key)
+    if extractor is not None:
+        return extractor
+
+    names = [p.strip() for p in header_line.split(',')]
+    names = [VARIABLE_ALIASES.get(name, name) for name in names]
+
+    # Column index of each requested variable, None when the cast didn't measure it
+    positions = [names.index(v) if v in names else None for v in variables]
+    present = [p for p in positions if p is not None]
+    last = max(present) if present else 0
+
+    def extractor(line):
+        # Only split as far as the last wanted column and only strip wanted fields
+        parts = line.split(',', last + 1)
+        if len(parts) <= last or not parts[0].strip().isdigit():
+            # UNITS / Prof-Flag rows and truncated lines carry no readings
+            return None
+        return [parts[p].strip() if p is not None else 'nan' for p in positions]
+
+    _extractor_cache[key] = extractor
+    return extractor
+
+def iter_casts(file_path, variables=VARIABLE_KEYS, start=0, end=None):
+    # Yield one cast at a time as each separator is crossed so memory stays flat
+    # regardless of how large the export file is. start/end are byte offsets on
+    # cast boundaries and restrict parsing to that slice of the file.
+    if start == 0 and end is None:
+        with open(file_path, 'r') as file:
+            yield from iter_casts_from_lines(file, variables)
+    else:
+        with open(file_path, 'rb') as file:
+            file.seek(start)
+            yield from iter_casts_from_lines(_read_lines(file, start, end), variables)
+
+def _read_lines(file, position, end):
+    # Decode lines from a binary file until the end offset is reached
+    for raw in file:
+        if end is not None and position >= end:
+            break
+        position += len(raw)
+        yield raw.decode()
+
+def iter_casts_from_lines(lines, variables=VARIABLE_KEYS):
+    # Each cast's VARIABLES header decides where the requested variables are read from
     cast = None
     variables_section = False
+    extractor = None
 
     for line in lines:
         # Check for new cast section
-        if line.startswith("#--------------------------------------------------------------------------------"):
+        if line.startswith(CAST_SEPARATOR):
             if cast:
-                casts.append(cast)
+                yield cast
             cast = {'metadata': {}, 'variables': []}
             variables_section = False
 
@@ -23,6 +90,7 @@ def parse_casts(file_path):
         elif cast is not None and not variables_section:
             if 'VARIABLES' in line:
                 variables_section = True
+                extractor = compile_extractor(line, variables)
             else:
                 parts = [p.strip() for p in line.split(',')]
                 if len(parts) > 2 and parts[2]:
@@ -35,65 +103,92 @@ def parse_casts(file_path):
             if 'END OF VARIABLES SECTION' in line:
                 variables_section = False
             else:
-                parts = [p.strip() for p in line.split(',')]
-                if len(parts) > 3:
-                    depth = parts[1]
-                    temperature = parts[4]
-                    salinity = parts[7]
-                    cast['variables'].append([depth, temperature, salinity])
+                values = extractor(line)
+                if values is not None:
+                    cast['variables'].append(values)
 
-    # Add the last cast
+    # Yield the last cast
     if cast:
-        casts.append(cast)
+        yield cast
+
 
-    return casts
+def parse_casts(file_path, variables=VARIABLE_KEYS):
+    return list(iter_casts(file_path, variables))
 
-def create_matrix(casts):
-    matrix = []
+def _to_float(values):
+    # One conversion per column; fall back to coercion when a column holds
+    # stray text (e.g. the UNITS row) so those entries become NaN
+    try:
+        return values.astype(np.float64)
+    except ValueError:
+        return np.array(pd.to_numeric(pd.Series(values), errors='coerce'), dtype=np.float64)
+
+def create_matrix(casts, sentinel_value=0.0, variables=VARIABLE_KEYS, cast_index=False):
+    # variables must match the list the casts were parsed with (Depth first).
+    # cast_index=True adds a 'cast_index' column numbering the casts in the batch.
+    # Column-oriented builder: gather the raw strings of every cast in the batch,
+    # convert each column once and broadcast the per-cast metadata with np.repeat
+    values = []
+    lengths = []
+    metadata_values = {key: [] for key in METADATA_KEYS}
 
     for cast in casts:
-        metadata = cast['metadata']
-        variables = cast['variables']
-        for var in variables:
-            depth = var[0]
-            temperature = var[1]
-            salinity = var[2]
-
-            # Check if any of the variables are null or NaN
-            if depth != '' and temperature != '' and salinity != '' and \
-               not pd.isnull(depth) and not pd.isnull(temperature) and not pd.isnull(salinity):
-                
-                # set null values to 0 for parsing reasons
-                if salinity == '---0---':
-                    salinity = '0'
-
-                if temperature == '---0---':
-                    temperature = '0'
-
-                #remove weird formatting where there is no trailing decimal
-                if depth.endswith('.'):
-                    depth += '0'
-                if temperature.endswith('.'):
-                    temperature += '0'
-                if salinity.endswith('.'):
-                    salinity += '0'
-                
-                row = [
-                    metadata.get('Latitude', ''),
-                    metadata.get('Longitude', ''),
-                    metadata.get('Year', ''),
-                    metadata.get('Month', ''),
-                    metadata.get('Day', ''),
-                    depth,        # Depth
-                    temperature,  # Temperature
-                    salinity      # Salinity
-                    # Add more elements here if necessary
-                ]
-                matrix.append(row)
-
-    return matrix
+        readings = cast['variables']
+        values.extend(readings)
+        lengths.append(len(readings))
+        for key in METADATA_KEYS:
+            metadata_values[key].append(cast['metadata'].get(METADATA_LABELS.get(key, key), ''))
+
+    if not values:
+        return pd.DataFrame(columns=METADATA_KEYS + list(variables) + (['cast_index'] if cast_index else []))
+
+    raw = np.array(values, dtype=str)
+
+    # Drop rows where any of the variables are blank
+    keep = (raw != '').all(axis=1)
+
+    # '---0---' marks a missing reading; float() already accepts '12.' style values
+    sentinel = raw == SENTINEL
+    raw = np.where(sentinel, 'nan', raw)
+
+    columns = {}
+    for key in METADATA_KEYS:
+        per_cast = _to_float(np.array(metadata_values[key], dtype=str))
+        # Keep Year/Month/Day and the cast number integral unless a cast is missing one
+        if key in INTEGER_KEYS and not np.isnan(per_cast).any():
+            per_cast = per_cast.astype(np.int64)
+        columns[key] = np.repeat(per_cast, lengths)
+
+    for i, key in enumerate(variables):
+        column = _to_float(raw[:, i])
+        if key != 'Depth':
+            column[sentinel[:, i]] = sentinel_value
+        columns[key] = column
+
+    # A row without a usable depth cannot be placed in a profile
+    keep &= ~np.isnan(columns['Depth'])
+
+    output_columns = METADATA_KEYS + list(variables)
+    if cast_index:
+        columns['cast_index'] = np.repeat(np.arange(len(lengths)), lengths)
+        output_columns.append('cast_index')
+
+    df = pd.DataFrame(columns, columns=output_columns)
+    return df[keep].reset_index(drop=True)
+
+def iter_matrix_chunks(casts, casts_per_chunk=1000, sentinel_value=0.0, variables=VARIABLE_KEYS, cast_index=False):
+    # Accepts a list of casts or the iter_casts generator and yields one
+    # DataFrame per batch of casts so large files can be processed as a stream
+    casts = iter(casts)
+    while True:
+        batch = list(islice(casts, casts_per_chunk))
+        if not batch:
+            break
+        yield create_matrix(batch, sentinel_value, variables, cast_index)
 
 def write_to_csv(matrix, output_file):
+    # matrix may be a DataFrame, an iterable of DataFrame chunks (iter_matrix_chunks)
+    # or a list of rows
     # Check if the file already exists
     if os.path.exists(output_file):
         # Append timestamp to the filename
@@ -101,22 +196,35 @@ def write_to_csv(matrix, output_file):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         output_file = f"{base}_{timestamp}{ext}"
 
-    header = ['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Depth', 'Temperature', 'Salinity']
+    if isinstance(matrix, pd.DataFrame):
+        matrix = [matrix]
 
     with open(output_file, 'w', newline='') as file:
         writer = csv.writer(file)
-        writer.writerow(header)
-        writer.writerows(matrix)
+        header_written = False
+        for chunk in matrix:
+            # DataFrame chunks carry their own header (extra variables included)
+            if isinstance(chunk, pd.DataFrame):
+                chunk.to_csv(file, index=False, header=not header_written)
+            else:
+                if not header_written:
+                    writer.writerow(MATRIX_COLUMNS)
+                writer.writerow(chunk)
+            header_written = True
+
+        if not header_written:
+            writer.writerow(MATRIX_COLUMNS)
 
     print(f'Data parsed and written to {output_file}')
+    return output_file
 
 
 # Example usage
-input_file = './content/ocldb1571108899.16715.CTD2.csv'
-output_file = './content/parsed/parsed_data.csv'
-
-casts = parse_casts(input_file)
-matrix = create_matrix(casts)
-write_to_csv(matrix, output_file)
-
-
+if __name__ == "__main__":
+    input_file = './content/ocldb1571108899.16715.CTD2.csv'
+    output_file = './content/parsed/parsed_data.csv'
+
+    # Stream casts straight through to the CSV without holding the file in memory
+    casts = iter_casts(input_file)
+    chunks = iter_matrix_chunks(casts)
+    write_to_csv(chunks, output_file)
@@ -3,109 +3,178 @@ import os
 from datetime import datetime
 import pandas as pd
 import numpy as np
-
-def parse_casts(file_path):
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-
-    casts = []
-    cast = None
-    variables_section = False
-
-    for line in lines:
-        # Check for new cast section
-        if line.startswith("#--------------------------------------------------------------------------------"):
-            if cast:
-                casts.append(cast)
-            cast = {'metadata': {}, 'variables': []}
-            variables_section = False
-
-        # Check if the line is a metadata line
-        elif cast is not None and not variables_section:
-            if 'VARIABLES' in line:
-                variables_section = True
-            else:
-                parts = [p.strip() for p in line.split(',')]
-                if len(parts) > 2 and parts[2]:
-                    key = parts[0].strip()
-                    value = parts[2].strip()
-                    cast['metadata'][key] = value
-
-        # Process the variables section
-        elif variables_section:
-            if 'END OF VARIABLES SECTION' in line:
-                variables_section = False
-            else:
-                parts = [p.strip() for p in line.split(',')]
-                if len(parts) > 3:
-                    depth = parts[1]
-                    temperature = parts[4]
-                    salinity = parts[7]
-                    cast['variables'].append([depth, temperature, salinity])
-
-    # Add the last cast
-    if cast:
-        casts.append(cast)
-
-    return casts
-
-def create_matrix(casts):
-    matrix = []
-
-    for cast in casts:
-        metadata = cast['metadata']
-        variables = cast['variables']
-        for var in variables:
-            depth = var[0]
-            temperature = var[1]
-            salinity = var[2]
-
-            # Check if any of the variables are null or NaN
-            if depth != '' and temperature != '' and salinity != '' and \
-               not pd.isnull(depth) and not pd.isnull(temperature) and not pd.isnull(salinity):
-                
-                # set null values to 0 for parsing reasons
-                if salinity == '---0---':
-                    salinity = '0'
-
-                if temperature == '---0---':
-                    temperature = '0'
-
-                # remove weird formatting where there is no trailing decimal
-                if depth.endswith('.'):
-                    depth += '0'
-                if temperature.endswith('.'):
-                    temperature += '0'
-                if salinity.endswith('.'):
-                    salinity += '0'
-                
-                row = [
-                    metadata.get('Latitude', ''),
-                    metadata.get('Longitude', ''),
-                    metadata.get('Year', ''),
-                    metadata.get('Month', ''),
-                    metadata.get('Day', ''),
-                    float(depth),        # Depth
-                    float(temperature),  # Temperature
-                    float(salinity)      # Salinity
-                    # Add more elements here if necessary
-                ]
-                matrix.append(row)
-
-    return matrix
-
-def bin_and_average(matrix):
-    df = pd.DataFrame(matrix, columns=['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Depth', 'Temperature', 'Salinity'])
-    df['Depth_bin'] = (df['Depth'] // 10) * 10
-
-    grouped = df.groupby(['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Depth_bin']).agg({
-        'Temperature': 'mean',
-        'Salinity': 'mean'
+from parser import METADATA_KEYS, VARIABLE_KEYS, iter_casts, iter_matrix_chunks
+
+BIN_KEYS = ['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Cast_number', 'Depth_bin']
+BIN_SIZES = [10, 50, 100, 500]
+
+def _partial_bins(df):
+    # Reduce a chunk of readings to per-bin sums/counts for every variable column
+    df = df.assign(Depth_bin=(df['Depth'] // 10) * 10)
+    value_columns = [c for c in df.columns if c not in BIN_KEYS and c != 'Depth']
+    aggregations = {}
+    for column in value_columns:
+        aggregations[f'{column}_sum'] = (column, 'sum')
+        aggregations[f'{column}_count'] = (column, 'count')
+    # dropna=False so readings of a cast without a cast number are still binned
+    return df.groupby(BIN_KEYS, dropna=False).agg(**aggregations)
+
+def bin_and_average(matrix, chunk_size=500000):
+    # matrix may be a DataFrame or an iterable of DataFrame chunks (iter_matrix_chunks);
+    # chunks are reduced to per-bin sums/counts so only the binned result is held in memory
+    if isinstance(matrix, pd.DataFrame):
+        matrix = [matrix]
+
+    partials = None
+    pending = []
+    pending_rows = 0
+
+    for chunk in matrix:
+        pending.append(chunk)
+        pending_rows += len(chunk)
+        if pending_rows < chunk_size:
+            continue
+
+        partial = _partial_bins(pd.concat(pending))
+        pending = []
+        pending_rows = 0
+
+        # Fold the chunk into the running totals
+        if partials is None:
+            partials = partial
+        else:
+            partials = pd.concat([partials, partial]).groupby(level=BIN_KEYS, dropna=False).sum()
+
+    if pending:
+        partial = _partial_bins(pd.concat(pending))
+        partials = partial if partials is None else \
+            pd.concat([partials, partial]).groupby(level=BIN_KEYS, dropna=False).sum()
+
+    if partials is None:
+        return pd.DataFrame(columns=BIN_KEYS + ['Temperature', 'Salinity'])
+
+    value_columns = [c[:-len('_sum')] for c in partials.columns if c.endswith('_sum')]
+    grouped = pd.DataFrame({
+        column: partials[f'{column}_sum'] / partials[f'{column}_count']
+        for column in value_columns
     }).reset_index()
 
     return grouped
 
+def _reduce_by_bin(df, bins, weights):
+    # Each (cast, bin) pair becomes one integer key, so the reduction is np.bincount
+    # over those keys instead of a multi-column groupby
+    casts = df['cast_index'].to_numpy(dtype=np.int64)
+    lowest = bins.min()
+    span = bins.max() - lowest + 1
+    keys = casts * span + (bins - lowest)
+
+    unique_keys, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    # Metadata comes from the first row of each cast/bin
+    reduced = {key: df[key].to_numpy()[first] for key in METADATA_KEYS}
+    reduced['cast_index'] = casts[first]
+    reduced['bin'] = (unique_keys % span) + lowest
+    for name, values in weights.items():
+        reduced[name] = np.bincount(inverse, weights=values, minlength=len(unique_keys))
+    return reduced
+
+def _value_columns(df):
+    return [c for c in df.columns if c not in METADATA_KEYS and c not in ('Depth', 'cast_index')]
+
+def bin_stats(df, bin_size=10):
+    # Per cast and depth bin, keep count, sum and sum of squares of every variable
+    # so coarser bins, means and standard deviations can be derived exactly later
+    value_columns = _value_columns(df)
+    stat_columns = [f'{c}_{stat}' for c in value_columns for stat in ('count', 'sum', 'sumsq')]
+    if df.empty:
+        return pd.DataFrame(columns=BIN_KEYS + ['cast_index'] + stat_columns)
+
+    weights = {}
+    for column in value_columns:
+        values = df[column].to_numpy(dtype=np.float64)
+        valid = ~np.isnan(values)
+        values = np.where(valid, values, 0.0)
+        weights[f'{column}_count'] = valid.astype(np.float64)
+        weights[f'{column}_sum'] = values
+        weights[f'{column}_sumsq'] = values * values
+
+    bins = np.floor(df['Depth'].to_numpy() / bin_size).astype(np.int64)
+    reduced = _reduce_by_bin(df, bins, weights)
+    reduced['Depth_bin'] = reduced.pop('bin').astype(np.float64) * bin_size
+    return pd.DataFrame(reduced, columns=BIN_KEYS + ['cast_index'] + stat_columns)
+
+def rebin_stats(stats, bin_size):
+    # Merge a bin_stats table into coarser bins. Exact when bin_size is a multiple
+    # of the source bin size. Without a cast_index column (e.g. a table read back
+    # from disk) casts are told apart by their metadata.
+    if 'Cast_number' not in stats.columns:
+        # Tables binned before cast numbers were kept
+        stats = stats.assign(Cast_number=np.nan)
+    if 'cast_index' not in stats.columns:
+        stats = stats.assign(cast_index=stats.groupby(METADATA_KEYS, sort=False, dropna=False).ngroup())
+
+    stat_columns = [c for c in stats.columns if c.endswith(('_count', '_sum', '_sumsq'))]
+    if stats.empty:
+        return pd.DataFrame(columns=BIN_KEYS + ['cast_index'] + stat_columns)
+
+    bins = np.floor(stats['Depth_bin'].to_numpy() / bin_size).astype(np.int64)
+    weights = {c: stats[c].to_numpy(dtype=np.float64) for c in stat_columns}
+    reduced = _reduce_by_bin(stats, bins, weights)
+    reduced['Depth_bin'] = reduced.pop('bin').astype(np.float64) * bin_size
+    return pd.DataFrame(reduced, columns=BIN_KEYS + ['cast_index'] + stat_columns)
+
+def summarize_stats(stats):
+    # Means and sample standard deviations from a bin_stats/rebin_stats table
+    value_columns = [c[:-len('_count')] for c in stats.columns if c.endswith('_count')]
+    summary = {key: stats[key] for key in BIN_KEYS}
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for column in value_columns:
+            count = stats[f'{column}_count'].to_numpy(dtype=np.float64)
+            total = stats[f'{column}_sum'].to_numpy(dtype=np.float64)
+            squares = stats[f'{column}_sumsq'].to_numpy(dtype=np.float64)
+            summary[column] = total / count
+            variance = (squares - total * total / count) / (count - 1)
+            summary[f'{column}_std'] = np.sqrt(np.clip(variance, 0.0, None))
+    return pd.DataFrame(summary)
+
+def bin_casts(df, bin_size=10):
+    # Average one batch from create_matrix(..., cast_index=True) into depth bins per cast
+    stats = bin_stats(df, bin_size)
+    means = summarize_stats(stats)
+    return means[[c for c in means.columns if not c.endswith('_std')]]
+
+def bin_multi(df, bin_sizes=BIN_SIZES):
+    # Bin one batch at several resolutions from a single pass over the raw readings:
+    # the finest resolution is computed from the readings and every coarser one that
+    # is a multiple of it is merged from those bins rather than the raw data
+    bin_sizes = sorted(bin_sizes)
+    finest = bin_sizes[0]
+    fine = bin_stats(df, finest)
+
+    results = {finest: fine}
+    for bin_size in bin_sizes[1:]:
+        if bin_size % finest == 0:
+            results[bin_size] = rebin_stats(fine, bin_size)
+        else:
+            results[bin_size] = bin_stats(df, bin_size)
+
+    # cast_index only numbers casts within this batch
+    return {size: stats.drop(columns='cast_index') for size, stats in results.items()}
+
+def iter_multi_binned_casts(casts, bin_sizes=BIN_SIZES, casts_per_chunk=1000, variables=VARIABLE_KEYS):
+    # Like iter_binned_casts, but yields {bin_size: stats DataFrame} per batch
+    for chunk in iter_matrix_chunks(casts, casts_per_chunk, variables=variables, cast_index=True):
+        yield bin_multi(chunk, bin_sizes)
+
+def iter_binned_casts(casts, bin_size=10, casts_per_chunk=1000, variables=VARIABLE_KEYS):
+    # Online alternative to bin_and_average: each batch of casts is binned as soon
+    # as it is parsed and emitted, so no file-wide frame or groupby is ever built.
+    for chunk in iter_matrix_chunks(casts, casts_per_chunk, variables=variables, cast_index=True):
+        yield bin_casts(chunk, bin_size)
+
 def write_to_csv(df, output_file):
+    # df may be a single DataFrame or an iterable of DataFrame chunks
     # Check if the file already exists
     if os.path.exists(output_file):
         # Append timestamp to the filename
@@ -113,17 +182,47 @@ def write_to_csv(df, output_file):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         output_file = f"{base}_{timestamp}{ext}"
 
-    header = ['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Depth_bin', 'Temperature', 'Salinity']
-
-    df.to_csv(output_file, index=False, columns=header)
+    if isinstance(df, pd.DataFrame):
+        df.to_csv(output_file, index=False)
+    else:
+        # Write the header once, then append each chunk as it arrives
+        write_header = True
+        for chunk in df:
+            chunk.to_csv(output_file, index=False,
+                         mode='w' if write_header else 'a', header=write_header)
+            write_header = False
     print(f'Data parsed and written to {output_file}')
+    return output_file
+
+def write_multi_to_csv(chunks, output_file):
+    # Stream {bin_size: DataFrame} chunks to one file per resolution,
+    # e.g. parsed_data_10m.csv, parsed_data_50m.csv, ...
+    base, ext = os.path.splitext(output_file)
+    output_files = {}
+
+    for chunk in chunks:
+        for bin_size, df in chunk.items():
+            if bin_size not in output_files:
+                path = f"{base}_{bin_size}m{ext}"
+                if os.path.exists(path):
+                    # Append timestamp to the filename
+                    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    path = f"{base}_{bin_size}m_{timestamp}{ext}"
+                df.to_csv(path, index=False)
+                output_files[bin_size] = path
+            else:
+                df.to_csv(output_files[bin_size], index=False, mode='a', header=False)
+
+    for path in output_files.values():
+        print(f'Data parsed and written to {path}')
+    return output_files
 
 
 # Example usage
-input_file = './content/ocldb1571108899.16715.CTD5.csv'
-output_file = './content/parsed/parsed_data.csv'
+if __name__ == "__main__":
+    input_file = './content/ocldb1571108899.16715.CTD5.csv'
+    output_file = './content/parsed/parsed_data.csv'
 
-casts = parse_casts(input_file)
-matrix = create_matrix(casts)
-averaged_df = bin_and_average(matrix)
-write_to_csv(averaged_df, output_file)
\ No newline at end of file
+    # Bin each cast as it is parsed and stream the binned rows to disk
+    casts = iter_casts(input_file)
+    write_to_csv(iter_binned_casts(casts), output_file)
@@ -0,0 +1,112 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+from database import date_key
+from main import describe_database, run_query
+
+class QueryService:
+    # Long-lived query object for repeated plotting requests: keeps one SQLite
+    # connection open per thread (each with a statement cache, so repeated query
+    # shapes skip re-preparing) and an LRU cache of recent results.
+
+    def __init__(self, db_file, cache_size=64, cached_statements=256):
+        self.db_file = db_file
+        self.cache_size = cache_size
+        self.cached_statements = cached_statements
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._connections = []
+        self._schema = None
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_file, cached_statements=self.cached_statements,
+                                   check_same_thread=False)
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _key(self, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude,
+             depth_bin_size, depth_limit):
+        # Normalise so '50', 50 and 50.0 share one cache entry
+        return (date_key(start_date), date_key(end_date), float(min_latitude), float(max_latitude),
+                float(min_longitude), float(max_longitude), float(depth_bin_size), float(depth_limit))
+
+    def query(self, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude,
+              depth_bin_size=100, depth_limit=10000):
+        # Same arguments and result as main.query_data_by_date_range
+        key = self._key(start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude,
+                        depth_bin_size, depth_limit)
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                # Hand out a copy so callers can't modify the cached frame
+                return cached.copy()
+            self.misses += 1
+
+        try:
+            conn = self._connection()
+            if self._schema is None:
+                self._schema = describe_database(conn)
+            df = run_query(conn, start_date, end_date, min_latitude, max_latitude, min_longitude,
+                           max_longitude, depth_bin_size, depth_limit, schema=self._schema)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            return None
+
+        with self._lock:
+            self._cache[key] = df
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return df.copy()
+
+    def invalidate(self):
+        # Call after loading new data: drops cached results and re-reads the schema
+        with self._lock:
+            self._cache.clear()
+            self._schema = None
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'entries': len(self._cache),
+                'capacity': self.cache_size,
+            }
+
+    def close(self):
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Example usage
+if __name__ == "__main__":
+    db_file = '/home/jpforbes/workspace/github.com/jpforbes5151/csvScraper/database/oceandata.db'
+
+    with QueryService(db_file) as service:
+        for _ in range(3):
+            df = service.query('2000-01-01', '2023-09-01', 50, 51, -42, -40, 100, 1000)
+        print(df)
+        print(service.stats())
@@ -0,0 +1,216 @@
+import copy
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+import pandas as pd
+
+SLOW_QUERY_LOG = './content/logs/slow_queries.jsonl'
+
+# Phases a query is timed in: cursor.execute, fetching rows, building the result
+# frame/arrays, and drawing the plot from it
+PHASES = ['sql', 'fetch', 'frame', 'render']
+
+# Instrumentation is off unless enable() is called; the query paths then pay for
+# one global lookup and a no-op context manager per phase
+_active = None
+
+def query_shape(query):
+    # Queries differing only in parameter values share a shape; the SQL text is
+    # already parameterized apart from the depth bin size and box count
+    normalized = re.sub(r'\s+', ' ', re.sub(r'--[^\n]*', '', query)).strip()
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12], normalized
+
+class _NullProfile:
+    # Stand-in returned while instrumentation is off
+    query_id = None
+
+    def phase(self, name):
+        return nullcontext()
+
+    def finish(self, rows=None):
+        pass
+
+    def tag(self, df):
+        return df
+
+NULL_PROFILE = _NullProfile()
+
+class QueryProfile:
+    # Timings and row count of one query, filled in by the query path
+
+    def __init__(self, log, query_id, shape, db_file, params):
+        self.log = log
+        self.query_id = query_id
+        self.shape = shape
+        self.db_file = db_file
+        self.params = params
+        self.timings = dict.fromkeys(PHASES, 0.0)
+        self.rows = None
+        self.started = datetime.now(timezone.utc).isoformat(timespec='milliseconds')
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] += time.perf_counter() - started
+
+    def finish(self, rows=None):
+        self.rows = rows
+        self.log._record(self, 'query')
+
+    def tag(self, df):
+        # Remember which query produced a result so plotting it can add render time
+        df.attrs['query_id'] = self.query_id
+        return df
+
+    def record(self, event):
+        return {
+            'event': event,
+            'ts': self.started,
+            'query_id': self.query_id,
+            'shape': self.shape,
+            'db': self.db_file,
+            'params': [p if isinstance(p, (int, float, str)) or p is None else str(p) for p in self.params],
+            'rows': self.rows,
+            'timings': {name: round(seconds, 6) for name, seconds in self.timings.items()},
+            'total': round(sum(self.timings.values()), 6),
+            'plan': self.log.plans.get(self.shape),
+        }
+
+class QueryLog:
+    # Collects QueryProfiles, captures EXPLAIN QUERY PLAN once per query shape and
+    # appends queries slower than threshold seconds to a JSON lines log
+
+    def __init__(self, slow_query_log=SLOW_QUERY_LOG, threshold=0.5, capture_plans=True, keep=1000):
+        self.slow_query_log = slow_query_log
+        self.threshold = threshold
+        self.capture_plans = capture_plans
+        self.plans = {}
+        self.shapes = {}
+        self.recent = deque(maxlen=keep)
+        self._profiles = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def start(self, conn, query, params):
+        shape, normalized = query_shape(query)
+        with self._lock:
+            query_id = f'{os.getpid()}-{next(self._ids)}'
+            new_shape = shape not in self.shapes
+            self.shapes.setdefault(shape, normalized)
+
+        if new_shape and self.capture_plans:
+            # Planning is cheap and doesn't run the query; kept out of the timings
+            plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+            with self._lock:
+                self.plans[shape] = plan
+
+        db_file = next((row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main'), None)
+        profile = QueryProfile(self, query_id, shape, db_file, params)
+        with self._lock:
+            self._profiles[query_id] = profile
+            # Only recent queries can still be rendered
+            while len(self._profiles) > self.recent.maxlen:
+                self._profiles.pop(next(iter(self._profiles)))
+        return profile
+
+    def _record(self, profile, event):
+        record = profile.record(event)
+        with self._lock:
+            self.recent.append(record)
+            if record['total'] >= self.threshold and self.slow_query_log:
+                directory = os.path.dirname(self.slow_query_log)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.slow_query_log, 'a') as file:
+                    file.write(json.dumps(record) + '\n')
+
+    def start_render(self, df):
+        profile = self._profiles.get(df.attrs.get('query_id'))
+        if profile is None:
+            return NULL_PROFILE
+        return _RenderProfile(profile)
+
+    def summary(self):
+        # Per query shape: how often it ran and its mean / max time in each phase
+        return summarize(self.recent)
+
+class _RenderProfile:
+    # Times the plot drawn from a query's result and logs it as a 'render' event
+    # carrying the query's other phases, so the end-to-end time is in one record.
+    # A result can be drawn many times (e.g. QueryService copies keep its
+    # query_id); each render is recorded on its own with only its own time.
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.started = time.perf_counter()
+
+    def finish(self, rows=None):
+        render = copy.copy(self.profile)
+        render.timings = dict(self.profile.timings, render=time.perf_counter() - self.started)
+        render.log._record(render, 'render')
+
+def summarize(records):
+    # records from QueryLog.recent or read_slow_log; one row per shape and event
+    rows = [dict(shape=r['shape'], event=r['event'], rows=r['rows'], total=r['total'], **r['timings'])
+            for r in records]
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame(rows)
+    return df.groupby(['shape', 'event']).agg(
+        count=('total', 'size'),
+        rows=('rows', 'mean'),
+        **{f'{name}_mean': (name, 'mean') for name in PHASES},
+        total_mean=('total', 'mean'),
+        total_max=('total', 'max'),
+    ).reset_index()
+
+def read_slow_log(slow_query_log=SLOW_QUERY_LOG):
+    with open(slow_query_log, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def enable(slow_query_log=SLOW_QUERY_LOG, threshold=0.5, capture_plans=True):
+    global _active
+    _active = QueryLog(slow_query_log, threshold, capture_plans)
+    return _active
+
+def disable():
+    global _active
+    _active = None
+
+def active():
+    return _active
+
+def start_query(conn, query, params):
+    # Called by the query paths in main.py; a no-op profile unless enabled
+    log = _active
+    if log is None:
+        return NULL_PROFILE
+    return log.start(conn, query, params)
+
+def start_render(df):
+    log = _active
+    if log is None:
+        return NULL_PROFILE
+    return log.start_render(df)
+
+
+# Example usage
+if __name__ == "__main__":
+    from main import query_data_by_date_range
+
+    db_file = '/home/jpforbes/workspace/github.com/jpforbes5151/csvScraper/database/oceandata.db'
+
+    log = enable(threshold=0.1)
+    query_data_by_date_range(db_file, '2000-01-01', '2023-09-01', 50, 51, -42, -40, 100, 1000)
+    print(log.summary())
+    print(log.plans)
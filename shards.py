@@ -0,0 +1,221 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from database import bulk_load, build_rollups, longitude_ranges, rollup_sizes
+from main import run_query
+from manifest import save_manifest
+
+# Describes the shards of a store directory: how rows were partitioned and the
+# year / position range each shard file covers
+LAYOUT_FILE = 'shards.json'
+
+# Result keys a merged query groups on; matches the GROUP BY of main.build_query
+GROUP_KEYS = ['Latitude', 'Longitude', 'Year', 'Month', 'Day', 'Depth_bin']
+
+def load_layout(shard_dir):
+    layout_file = os.path.join(shard_dir, LAYOUT_FILE)
+    if not os.path.exists(layout_file):
+        return None
+    with open(layout_file, 'r') as file:
+        return json.load(file)
+
+def save_layout(layout, shard_dir):
+    # Same atomic JSON write as the ingest manifest
+    save_manifest(layout, os.path.join(shard_dir, LAYOUT_FILE))
+
+def _tile(values, degrees, low, high):
+    # Lower edge of the tile each value falls in; the top edge joins the last tile
+    return np.minimum(np.floor((values - low) / degrees) * degrees + low, high - degrees)
+
+def _shard_entry(layout, decade, latitude, longitude):
+    # File name and covered ranges of one shard; None means unbounded on that axis
+    names = []
+    entry = {'years': None, 'latitude': None, 'longitude': None}
+    if decade is not None:
+        names.append(f'{int(decade)}s')
+        entry['years'] = [int(decade), int(decade) + 9]
+    if latitude is not None:
+        degrees = layout['region_degrees']
+        names.append(f'lat{int(latitude):+03d}_lon{int(longitude):+04d}')
+        entry['latitude'] = [float(latitude), float(latitude) + degrees]
+        entry['longitude'] = [float(longitude), float(longitude) + degrees]
+    entry['file'] = f"oceandata_{'_'.join(names)}.db"
+    return entry
+
+def split_by_shard(chunk, layout):
+    # Yield (shard entry, rows) for each shard the rows of a chunk belong to. A cast
+    # always lands in the same shard, so reloads still hit its uniqueness keys.
+    keys = {}
+    if 'decade' in layout['by']:
+        keys['decade'] = np.floor(chunk['Year'].to_numpy(dtype=np.float64) / 10) * 10
+    if 'region' in layout['by']:
+        degrees = layout['region_degrees']
+        keys['latitude'] = _tile(chunk['Latitude'].to_numpy(dtype=np.float64), degrees, -90, 90)
+        keys['longitude'] = _tile(chunk['Longitude'].to_numpy(dtype=np.float64), degrees, -180, 180)
+
+    # Rows missing a year or position have no shard (bulk_load would skip them anyway)
+    groups = pd.DataFrame(keys).groupby(list(keys), sort=False).indices
+    for values, rows in groups.items():
+        values = dict(zip(keys, values if isinstance(values, tuple) else (values,)))
+        entry = _shard_entry(layout, values.get('decade'), values.get('latitude'), values.get('longitude'))
+        yield entry, chunk.iloc[rows]
+
+def _queued(pieces):
+    # Chunks put on a writer's queue, until the None that ends the load
+    while True:
+        rows = pieces.get()
+        if rows is None:
+            return
+        yield rows
+
+def _shard_writer(pieces, db_file, on_conflict, results, name):
+    chunks = _queued(pieces)
+    results[name] = bulk_load(chunks, db_file, on_conflict=on_conflict)
+    # Keep draining after a failed load so the producer never blocks on a full queue
+    for _ in chunks:
+        pass
+
+def load_sharded(chunks, shard_dir, by=('decade',), region_degrees=30, on_conflict='skip', queue_size=4):
+    # Partition binned rows (a DataFrame or an iterable of DataFrame chunks) by decade
+    # and/or lat/lon region into one SQLite file per shard. Each shard gets its own
+    # writer thread running bulk_load, so shards fill concurrently without sharing a
+    # write lock. The partitioning of an existing store directory is kept.
+    # Returns the summed {'inserted', 'replaced', 'skipped'} counts.
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    os.makedirs(shard_dir, exist_ok=True)
+
+    layout = load_layout(shard_dir)
+    if layout is None:
+        if not set(by) <= {'decade', 'region'} or not by:
+            raise ValueError("by must name 'decade', 'region' or both")
+        if 180 % region_degrees:
+            raise ValueError('region_degrees must divide 180')
+        layout = {'by': list(by), 'region_degrees': region_degrees, 'rollups': [], 'shards': {}}
+
+    writers = {}
+    results = {}
+    unplaced = 0
+    try:
+        for chunk in chunks:
+            placed = 0
+            for entry, rows in split_by_shard(chunk, layout):
+                name = entry['file']
+                if name not in writers:
+                    pieces = queue.Queue(queue_size)
+                    thread = threading.Thread(target=_shard_writer, args=(
+                        pieces, os.path.join(shard_dir, name), on_conflict, results, name))
+                    thread.start()
+                    writers[name] = (pieces, thread)
+                    layout['shards'].setdefault(name, entry)
+                writers[name][0].put(rows)
+                placed += len(rows)
+            unplaced += len(chunk) - placed
+    finally:
+        for pieces, _ in writers.values():
+            pieces.put(None)
+        for _, thread in writers.values():
+            thread.join()
+
+    # Shards created by this load get the rollups the rest of the store has
+    for name in writers:
+        if layout['rollups'] and results.get(name) and results[name]['inserted']:
+            db_file = os.path.join(shard_dir, name)
+            conn = sqlite3.connect(db_file)
+            missing = not rollup_sizes(conn)
+            conn.close()
+            if missing:
+                build_rollups(db_file, layout['rollups'])
+    save_layout(layout, shard_dir)
+
+    totals = {'inserted': 0, 'replaced': 0, 'skipped': unplaced}
+    for name, counts in results.items():
+        if counts is None:
+            print(f"Shard {name} failed to load")
+            continue
+        for key in totals:
+            totals[key] += counts[key]
+    print(f"Loaded {totals['inserted']} rows into {len(writers)} shards under {shard_dir} "
+          f"({totals['replaced']} replaced, {totals['skipped']} skipped)")
+    return totals
+
+def build_shard_rollups(shard_dir, bin_sizes, max_workers=None):
+    # build_rollups on every shard in parallel; later loads keep them current
+    layout = load_layout(shard_dir)
+    files = [os.path.join(shard_dir, entry['file']) for entry in layout['shards'].values()]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(lambda db_file: build_rollups(db_file, bin_sizes), files))
+    layout['rollups'] = sorted(set(layout['rollups']) | set(bin_sizes))
+    save_layout(layout, shard_dir)
+
+def _overlaps(low, high, covered):
+    return covered is None or (low <= covered[1] and high >= covered[0])
+
+def route(layout, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude):
+    # Shard files that can hold rows for the date range and bounding box
+    start_year, end_year = int(str(start_date)[:4]), int(str(end_date)[:4])
+    lon_ranges = longitude_ranges(min_longitude, max_longitude)
+    return [entry['file'] for entry in layout['shards'].values()
+            if _overlaps(start_year, end_year, entry['years'])
+            and _overlaps(float(min_latitude), float(max_latitude), entry['latitude'])
+            and any(_overlaps(low, high, entry['longitude']) for low, high in lon_ranges)]
+
+def _query_shard(db_file, args):
+    # Per-shard partial aggregate; top level so a process pool can pickle it
+    conn = sqlite3.connect(db_file)
+    try:
+        return run_query(conn, *args, partial=True)
+    finally:
+        conn.close()
+
+def merge_partials(partials):
+    # Sums and counts add across shards; the average is taken only once merged
+    partials = [df for df in partials if len(df)]
+    if not partials:
+        return pd.DataFrame(columns=GROUP_KEYS + ['Temperature'])
+    merged = pd.concat(partials, ignore_index=True)
+    merged = merged.groupby(GROUP_KEYS, as_index=False, dropna=False)[
+        ['Temperature_sum', 'Temperature_count']].sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        temperature = merged['Temperature_sum'] / merged['Temperature_count'].replace(0, np.nan)
+    merged = merged[GROUP_KEYS].assign(Temperature=temperature)
+    return merged.sort_values(GROUP_KEYS, ignore_index=True)
+
+def query_shards(shard_dir, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude, depth_bin_size=100, depth_limit=10000, max_workers=None, processes=False):
+    # Same arguments and result columns as main.query_data_by_date_range, answered by
+    # fanning out to the overlapping shards in a thread pool (or a process pool with
+    # processes=True) and merging their per-bin sums and counts
+    try:
+        layout = load_layout(shard_dir)
+        files = route(layout, start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude)
+        args = (start_date, end_date, min_latitude, max_latitude, min_longitude, max_longitude,
+                depth_bin_size, depth_limit)
+        if len(files) <= 1:
+            partials = [_query_shard(os.path.join(shard_dir, f), args) for f in files]
+        else:
+            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            with pool(max_workers=max_workers or min(len(files), os.cpu_count() or 1)) as executor:
+                partials = list(executor.map(_query_shard, [os.path.join(shard_dir, f) for f in files],
+                                             [args] * len(files)))
+        return merge_partials(partials)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return None
+
+
+# Example usage
+if __name__ == "__main__":
+    from parser import iter_casts
+    from parserbybin import iter_binned_casts
+
+    input_file = './content/ocldb1571108899.16715.CTD2.csv'
+    shard_dir = '/home/jpforbes/workspace/github.com/jpforbes5151/csvScraper/database/shards'
+
+    load_sharded(iter_binned_casts(iter_casts(input_file), 10), shard_dir, by=('decade', 'region'))
+    print(query_shards(shard_dir, '2000-01-01', '2023-09-01', 50, 51, -42, -40, 100, 1000))
@@ -0,0 +1,199 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from cubes import draw_cubes
+
+# Grid axes in the order the cube plots use: x = Latitude, y = Longitude, z = depth
+GRID_AXES = ['Latitude', 'Longitude', 'Depth_bin']
+
+class VoxelGrid:
+    # Regular lat/lon/depth grid of per-cell means and counts. A dense grid holds
+    # (n_lat, n_lon, n_depth) arrays with NaN in empty cells; a sparse grid holds
+    # only the occupied cells, as flat indices into that shape. Longitudes may run
+    # past 180 when the grid crosses the antimeridian.
+
+    def __init__(self, edges, mean, count, cells=None):
+        self.edges = [np.asarray(e, dtype=np.float64) for e in edges]
+        self.mean = mean
+        self.count = count
+        self.cells = cells
+
+    @property
+    def shape(self):
+        return tuple(len(e) - 1 for e in self.edges)
+
+    @property
+    def is_sparse(self):
+        return self.cells is not None
+
+    def centers(self):
+        return [(e[:-1] + e[1:]) / 2 for e in self.edges]
+
+    def to_dense(self):
+        if not self.is_sparse:
+            return self
+        mean = np.full(self.shape, np.nan)
+        count = np.zeros(self.shape, dtype=np.int64)
+        mean.flat[self.cells] = self.mean
+        count.flat[self.cells] = self.count
+        return VoxelGrid(self.edges, mean, count)
+
+    def to_sparse(self):
+        if self.is_sparse:
+            return self
+        cells = np.flatnonzero(~np.isnan(self.mean))
+        return VoxelGrid(self.edges, self.mean.flat[cells], self.count.flat[cells], cells)
+
+    def occupied(self):
+        # Centre coordinates and value of every cell with a value, as flat arrays
+        grid = self.to_sparse()
+        index = np.unravel_index(grid.cells, self.shape)
+        centers = self.centers()
+        return centers[0][index[0]], centers[1][index[1]], centers[2][index[2]], grid.mean
+
+    def save(self, path):
+        # .npz keeps the grid for reuse without re-querying or re-gridding
+        arrays = {'lat_edges': self.edges[0], 'lon_edges': self.edges[1], 'depth_edges': self.edges[2],
+                  'mean': self.mean, 'count': self.count}
+        if self.is_sparse:
+            arrays['cells'] = self.cells
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            edges = [data['lat_edges'], data['lon_edges'], data['depth_edges']]
+            cells = data['cells'] if 'cells' in data else None
+            return cls(edges, data['mean'], data['count'], cells)
+
+def grid_edges(low, high, step):
+    # Edges on multiples of step that cover [low, high]; a value on the top edge
+    # falls in the last cell rather than opening another. Ratios are rounded so a
+    # bound on an edge stays on it with steps such as 0.1.
+    first = np.floor(np.round(low / step, 9)) * step
+    cells = max(int(np.ceil(np.round((high - first) / step, 9))), 1)
+    return first + step * np.arange(cells + 1)
+
+def build_grid(df, resolution=(0.25, 0.25, 100), value='Temperature', bounds=None, sparse=False):
+    # Assign query results (main.query_data_by_date_range) to a regular grid and
+    # average value per cell. resolution is (degrees latitude, degrees longitude,
+    # metres). bounds is (min_lat, max_lat, min_lon, max_lon, min_depth, max_depth)
+    # and defaults to the extent of the data; a min_lon east of max_lon is a box
+    # across the antimeridian, as in the queries.
+    coordinates = [df[axis].to_numpy(dtype=np.float64) for axis in GRID_AXES]
+    values = df[value].to_numpy(dtype=np.float64)
+
+    if bounds is not None and bounds[2] > bounds[3]:
+        # Continue longitudes past 180 so the box is one contiguous range
+        coordinates[1] = np.where(coordinates[1] < bounds[2], coordinates[1] + 360, coordinates[1])
+        bounds = bounds[:3] + (bounds[3] + 360,) + bounds[4:]
+
+    keep = ~np.isnan(values)
+    for axis in coordinates:
+        keep &= ~np.isnan(axis)
+    if bounds is not None:
+        for i, axis in enumerate(coordinates):
+            keep &= (axis >= bounds[2 * i]) & (axis <= bounds[2 * i + 1])
+    coordinates = [axis[keep] for axis in coordinates]
+    values = values[keep]
+
+    edges = []
+    for i, axis in enumerate(coordinates):
+        if bounds is not None:
+            low, high = bounds[2 * i], bounds[2 * i + 1]
+        elif len(axis):
+            low, high = axis.min(), axis.max()
+        else:
+            low = high = 0.0
+        edges.append(grid_edges(low, high, resolution[i]))
+
+    shape = tuple(len(e) - 1 for e in edges)
+    index = [np.clip(((axis - e[0]) // step).astype(np.int64), 0, n - 1)
+             for axis, e, step, n in zip(coordinates, edges, resolution, shape)]
+    flat = np.ravel_multi_index(index, shape)
+
+    # Same sum / count reduction as the binning: one bincount per statistic
+    cells, inverse = np.unique(flat, return_inverse=True)
+    sums = np.bincount(inverse, weights=values, minlength=len(cells))
+    counts = np.bincount(inverse, minlength=len(cells))
+    grid = VoxelGrid(edges, sums / np.maximum(counts, 1), counts, cells)
+    return grid if sparse else grid.to_dense()
+
+def fill_gaps(grid, iterations=3, axes=(0, 1, 2)):
+    # Fill empty cells from their filled face neighbours along the given axes, one
+    # ring per iteration, so gaps up to that many cells wide are interpolated.
+    # Cells filled this way keep a count of 0; the result is dense.
+    grid = grid.to_dense()
+    mean = grid.mean.copy()
+    for _ in range(iterations):
+        empty = np.isnan(mean)
+        if not empty.any():
+            break
+        filled = np.where(empty, 0.0, mean)
+        present = (~empty).astype(np.float64)
+        sums = np.zeros_like(mean)
+        neighbours = np.zeros_like(mean)
+        for axis in axes:
+            for shift in (1, -1):
+                # Shift without wrapping: the cell that moves in from the edge is empty
+                rolled = np.roll(filled, shift, axis=axis)
+                rolled_present = np.roll(present, shift, axis=axis)
+                edge = [slice(None)] * mean.ndim
+                edge[axis] = 0 if shift == 1 else -1
+                rolled[tuple(edge)] = 0.0
+                rolled_present[tuple(edge)] = 0.0
+                sums += rolled
+                neighbours += rolled_present
+        fill = empty & (neighbours > 0)
+        mean[fill] = sums[fill] / neighbours[fill]
+    return VoxelGrid(grid.edges, mean, grid.count)
+
+def plot_voxel_grid(grid, cmap='coolwarm', alpha=0.5, edgecolors='k', linewidths=0.2):
+    # One cube per occupied cell, sized to the cell, drawn as a single collection
+    latitudes, longitudes, depths, values = grid.occupied()
+    fig = plt.figure(figsize=(10, 8))
+    ax = fig.add_subplot(111, projection='3d')
+
+    cmap = plt.get_cmap(cmap)
+    norm = plt.Normalize(np.nanmin(values), np.nanmax(values))
+    half_size = [np.diff(e[:2])[0] / 2 for e in grid.edges]
+    draw_cubes(ax, latitudes, longitudes, depths, values, half_size, cmap, norm,
+               alpha=alpha, edgecolors=edgecolors, linewidths=linewidths)
+
+    ax.set_xlabel('Latitude')
+    ax.set_ylabel('Longitude')
+    ax.set_zlabel('Depth (m)')
+    ax.set_xlim(grid.edges[0][0], grid.edges[0][-1])
+    ax.set_ylim(grid.edges[1][0], grid.edges[1][-1])
+    ax.set_zlim(grid.edges[2][-1], grid.edges[2][0])  # inverted depths
+    ax.set_box_aspect([1, 1, 1])
+
+    sm = plt.cm.ScalarMappable(cmap=cmap, norm=norm)
+    sm.set_array([])
+    fig.colorbar(sm, ax=ax, label='Temperature (°C)')
+    return fig
+
+def plot_depth_slice(grid, depth, cmap='coolwarm'):
+    # Map view of the layer containing depth
+    grid = grid.to_dense()
+    layer = int(np.clip(np.searchsorted(grid.edges[2], depth, side='right') - 1, 0, grid.shape[2] - 1))
+    fig, ax = plt.subplots(figsize=(10, 6))
+    mesh = ax.pcolormesh(grid.edges[1], grid.edges[0], grid.mean[:, :, layer], cmap=cmap)
+    ax.set_xlabel('Longitude')
+    ax.set_ylabel('Latitude')
+    ax.set_title(f'Temperature at {grid.edges[2][layer]:g}-{grid.edges[2][layer + 1]:g} m')
+    fig.colorbar(mesh, ax=ax, label='Temperature (°C)')
+    return fig
+
+
+# Example usage
+if __name__ == "__main__":
+    from main import query_data_by_date_range
+
+    db_file = '/home/jpforbes/workspace/github.com/jpforbes5151/csvScraper/database/oceandata.db'
+
+    df = query_data_by_date_range(db_file, '2000-01-01', '2023-09-01', 50, 51, -42, -40, 100, 1000)
+    grid = build_grid(df, resolution=(0.1, 0.1, 100), bounds=(50, 51, -42, -40, 0, 1000))
+    grid.save('./content/parsed/grid.npz')
+    plot_voxel_grid(fill_gaps(grid, iterations=1))
+    plot_depth_slice(grid, 100)
+    plt.show()